@@ -0,0 +1,312 @@
+"""
+Variance anomaly detection over the reconciliation history.
+
+Each property keeps an exponentially weighted baseline (mean/variance, in
+cents) per metric: actual rent, HOA and mortgage. HOA baselines are kept per
+payment phase (month index % HOA period from hoa_frequency), so a quarterly
+HOA's quiet months are compared with earlier quiet months and its due months
+with earlier due months. A month is an outlier when |z| >= ANOMALY_Z against
+a baseline with at least ANOMALY_MIN_HISTORY observations. A short rent that
+the next month's surplus makes up is reported as LATE_RENT, not OUTLIER.
+
+Every step is vectorized over properties. Publishing a month scores it
+against the stored baselines and folds it in (incremental). The rebuild
+replays the whole property x month history as NumPy arrays, one vector
+step per month:
+
+    python -m app.anomaly --rebuild
+"""
+import os
+import sys
+import argparse
+import logging
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.database import without_statement_timeout
+from app.models import AnomalyBaseline, PropertyReconLog, ReconAnomaly
+from app.money import to_cents, from_cents
+from app.parameters import parameter_store
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_Z = float(os.getenv("ANOMALY_Z", "3.0"))
+ANOMALY_WINDOW_MONTHS = int(os.getenv("ANOMALY_WINDOW_MONTHS", "12"))  # span of the weighted baseline
+ANOMALY_MIN_HISTORY = int(os.getenv("ANOMALY_MIN_HISTORY", "3"))
+# Spread floor so a perfectly steady history doesn't flag a few dollars of change
+ANOMALY_MIN_STD_CENTS = int(os.getenv("ANOMALY_MIN_STD_CENTS", "2500"))
+ANOMALY_REL_STD = float(os.getenv("ANOMALY_REL_STD", "0.02"))
+
+ALPHA = 2.0 / (ANOMALY_WINDOW_MONTHS + 1)
+MAX_PHASES = 12
+METRICS = {"rent": "actual_rent", "hoa": "actual_hoa", "mortgage": "actual_mortgage"}
+OUTLIER, LATE_RENT = "OUTLIER", "LATE_RENT"
+
+def month_index(month: date) -> int:
+    return month.year * 12 + month.month - 1
+
+def month_from_index(index: int) -> date:
+    year, month = divmod(int(index), 12)
+    return date(year, month + 1, 1)
+
+def _periods(addresses, params) -> np.ndarray:
+    by_address = {p.address.strip().upper(): p.hoa_period for p in params}
+    return np.array([by_address.get(str(a).strip().upper(), 1) for a in addresses], dtype=np.int64)
+
+def _phase(metric: str, t: int, periods: np.ndarray) -> np.ndarray:
+    return t % periods if metric == "hoa" else np.zeros(len(periods), dtype=np.int64)
+
+def _spread_floor(baseline):
+    return np.maximum(ANOMALY_MIN_STD_CENTS, ANOMALY_REL_STD * np.abs(baseline))
+
+# ----------- Baseline state (property x phase) ------------
+class Baselines:
+    """Weighted mean/variance per (property, phase) for one metric; one vector step per month."""
+
+    def __init__(self, n_properties: int):
+        shape = (n_properties, MAX_PHASES)
+        self.mean = np.zeros(shape)
+        self.var = np.zeros(shape)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.last = np.full(shape, -1, dtype=np.int64)
+
+    def step(self, x: np.ndarray, phase: np.ndarray, t: int):
+        """Scores month t (x in cents, NaN = no data) and folds it in. Returns (z, flagged, baseline)."""
+        rows = np.arange(len(x))
+        m, v, n = self.mean[rows, phase], self.var[rows, phase], self.count[rows, phase]
+        present = ~np.isnan(x)
+        values = np.nan_to_num(x)
+
+        scale = np.maximum(np.sqrt(v), _spread_floor(m))
+        scored = present & (n >= ANOMALY_MIN_HISTORY)
+        z = np.where(scored, (values - m) / scale, 0.0)
+        flagged = np.abs(z) >= ANOMALY_Z
+
+        # A re-run of an already folded month doesn't count twice; outliers are clipped so a
+        # single bad month can't drag the baseline (a lasting change still gets learned)
+        fresh = present & (self.last[rows, phase] < t)
+        first = fresh & (n == 0)
+        folded = np.where(scored, np.clip(values, m - ANOMALY_Z * scale, m + ANOMALY_Z * scale), values)
+        diff = folded - m
+        increment = ALPHA * diff
+
+        self.mean[rows, phase] = np.where(first, folded, np.where(fresh, m + increment, m))
+        self.var[rows, phase] = np.where(fresh & ~first, (1 - ALPHA) * (v + diff * increment), v)
+        self.count[rows, phase] = n + fresh
+        self.last[rows, phase] = np.where(fresh, t, self.last[rows, phase])
+        return z, flagged, m
+
+    def to_rows(self, addresses, metric: str) -> List[dict]:
+        props, phases = np.nonzero(self.count > 0)
+        return [
+            {
+                "address": addresses[p], "metric": metric, "phase": int(ph),
+                "count": int(self.count[p, ph]), "mean_cents": float(self.mean[p, ph]),
+                "var_cents": float(self.var[p, ph]), "last_month": month_from_index(self.last[p, ph]),
+            }
+            for p, ph in zip(props, phases)
+        ]
+
+def _load_baselines(db: Session, addresses) -> Dict[str, Baselines]:
+    states = {metric: Baselines(len(addresses)) for metric in METRICS}
+    position = {a: i for i, a in enumerate(addresses)}
+    rows = db.execute(select(
+        AnomalyBaseline.address, AnomalyBaseline.metric, AnomalyBaseline.phase, AnomalyBaseline.count,
+        AnomalyBaseline.mean_cents, AnomalyBaseline.var_cents, AnomalyBaseline.last_month
+    ).where(AnomalyBaseline.address.in_(set(addresses)))).all()
+    for row in rows:
+        state = states.get(row.metric)
+        if state is None:
+            continue
+        i = position[row.address]
+        state.mean[i, row.phase] = row.mean_cents
+        state.var[i, row.phase] = row.var_cents
+        state.count[i, row.phase] = row.count
+        state.last[i, row.phase] = month_index(row.last_month) if row.last_month else -1
+    return states
+
+def _late_rent(prev_x, prev_base, prev_flagged, x, base):
+    """Short month followed by a surplus that (within tolerance) makes it up."""
+    return (
+        prev_flagged & (prev_x < prev_base) & (x > base)
+        & (np.abs((prev_x + x) - (prev_base + base)) <= _spread_floor(prev_base))
+    )
+
+def _anomaly_rows(addresses, managers, metric, month_of, flagged, x, base, z, kind) -> List[dict]:
+    # Only flagged cells become rows (a handful per month)
+    return [
+        {
+            "month_year": month_of(i), "address": addresses[i[0]], "property_management": managers[i[0]],
+            "metric": metric, "value": from_cents(int(x[i])), "baseline": from_cents(int(round(base[i]))),
+            "zscore": round(float(z[i]), 2), "kind": kind[i],
+        }
+        for i in zip(*np.nonzero(flagged))
+    ]
+
+# ----------- Incremental: one month at publish time ------------
+def _score_month(db: Session, month: date, recon_rows: List[dict], params) -> int:
+    t = month_index(month)
+    addresses = [r["address"] for r in recon_rows]
+    managers = [r.get("property_management") for r in recon_rows]
+    periods = _periods(addresses, params)
+    states = _load_baselines(db, addresses)
+
+    # Last month's rent outliers, to recognise a late payment made up this month
+    previous = {
+        row.address: row for row in db.execute(
+            select(ReconAnomaly.id, ReconAnomaly.address, ReconAnomaly.value, ReconAnomaly.baseline).where(
+                ReconAnomaly.month_year == month_from_index(t - 1),
+                ReconAnomaly.metric == "rent",
+                ReconAnomaly.kind == OUTLIER,
+                ReconAnomaly.address.in_(set(addresses))
+            )
+        ).all()
+    }
+
+    anomalies = []
+    for metric, column in METRICS.items():
+        x = to_cents([r.get(column) for r in recon_rows]).astype(float)
+        z, flagged, base = states[metric].step(x, _phase(metric, t, periods), t)
+        kind = np.full(len(x), OUTLIER, dtype=object)
+
+        if metric == "rent" and previous:
+            prev = [previous.get(a) for a in addresses]
+            prev_x = np.array([np.nan if p is None else float(to_cents(p.value)) for p in prev])
+            prev_base = np.array([np.nan if p is None else float(to_cents(p.baseline)) for p in prev])
+            late = _late_rent(prev_x, prev_base, ~np.isnan(prev_x), x, base)
+            if late.any():
+                late_ids = [prev[i].id for i in np.nonzero(late)[0]]
+                db.execute(update(ReconAnomaly).where(ReconAnomaly.id.in_(late_ids)).values(kind=LATE_RENT))
+                kind[late & flagged] = LATE_RENT
+
+        anomalies += _anomaly_rows(
+            addresses, managers, metric, lambda i: month, flagged[:, None], x[:, None], base[:, None], z[:, None], kind[:, None]
+        )
+
+    db.execute(delete(ReconAnomaly).where(ReconAnomaly.month_year == month))
+    if anomalies:
+        db.execute(insert(ReconAnomaly), anomalies)
+
+    db.execute(delete(AnomalyBaseline).where(AnomalyBaseline.address.in_(set(addresses))))
+    baseline_rows = [row for metric, state in states.items() for row in state.to_rows(addresses, metric)]
+    if baseline_rows:
+        db.execute(insert(AnomalyBaseline), baseline_rows)
+    return len(anomalies)
+
+def score_month(db: Session, month: date, recon_rows: List[dict], params) -> int:
+    """
+    Flags the month's outliers and updates the baselines inside the caller's
+    transaction. Runs in a savepoint: a scoring failure (e.g. two months
+    published at once racing on the same baselines) is logged and never
+    blocks publishing the month.
+    """
+    if not recon_rows:
+        return 0
+    try:
+        with db.begin_nested():
+            return _score_month(db, month, recon_rows, params)
+    except Exception as e:
+        logger.error(f"Anomaly scoring skipped for {month:%Y-%m}: {e} (python -m app.anomaly --rebuild)")
+        return 0
+
+# ----------- Batch: the whole history ------------
+class History(NamedTuple):
+    addresses: List[str]
+    managers: List[Optional[str]]
+    first_month: int                  # month index of column 0
+    values: Dict[str, np.ndarray]     # metric -> (properties x months) cents, NaN where not reconciled
+
+def load_history(db: Session) -> Optional[History]:
+    rows = db.execute(select(
+        PropertyReconLog.month_year, PropertyReconLog.address, PropertyReconLog.property_management,
+        *[getattr(PropertyReconLog, column) for column in METRICS.values()]
+    )).all()
+    if not rows:
+        return None
+
+    columns = list(zip(*rows))
+    months = np.array([month_index(m) for m in columns[0]])
+    addresses, prop_idx = np.unique(np.array(columns[1], dtype=object).astype(str), return_inverse=True)
+    first_month = int(months.min())
+    month_idx = months - first_month
+    shape = (len(addresses), int(month_idx.max()) + 1)
+
+    managers = np.empty(len(addresses), dtype=object)
+    managers[prop_idx] = columns[2]
+    values = {}
+    for offset, metric in enumerate(METRICS):
+        grid = np.full(shape, np.nan)
+        grid[prop_idx, month_idx] = to_cents(columns[3 + offset])
+        values[metric] = grid
+    return History(list(addresses), list(managers), first_month, values)
+
+def rebuild_anomalies(db: Session) -> dict:
+    """Replays every reconciled month, vectorized over properties, and rewrites baselines + anomalies."""
+    without_statement_timeout(db)  # reads and rewrites the whole history
+    history = load_history(db)
+    db.execute(delete(ReconAnomaly))
+    db.execute(delete(AnomalyBaseline))
+    if history is None:
+        db.commit()
+        return {"properties": 0, "months": 0, "anomalies": 0}
+
+    n_props, n_months = history.values["rent"].shape
+    # HOA period as of each replayed month (point in time, like run_reconciliation), not today's
+    months = [history.first_month + col for col in range(n_months)]
+    periods_by_month = [
+        _periods(history.addresses, parameter_store.for_month(db, month_from_index(t))) for t in months
+    ]
+    anomalies, baseline_rows = [], []
+
+    for metric, x in history.values.items():
+        state = Baselines(n_props)
+        z = np.zeros(x.shape)
+        flagged = np.zeros(x.shape, dtype=bool)
+        base = np.zeros(x.shape)
+        for col, t in enumerate(months):
+            phase = _phase(metric, t, periods_by_month[col])
+            z[:, col], flagged[:, col], base[:, col] = state.step(x[:, col], phase, t)
+
+        kind = np.full(x.shape, OUTLIER, dtype=object)
+        if metric == "rent" and n_months > 1:
+            late = _late_rent(x[:, :-1], base[:, :-1], flagged[:, :-1], x[:, 1:], base[:, 1:])
+            kind[:, :-1][late] = LATE_RENT
+            kind[:, 1:][late & flagged[:, 1:]] = LATE_RENT
+
+        anomalies += _anomaly_rows(
+            history.addresses, history.managers, metric,
+            lambda i: month_from_index(history.first_month + i[1]), flagged, x, base, z, kind
+        )
+        baseline_rows += state.to_rows(history.addresses, metric)
+
+    if anomalies:
+        db.execute(insert(ReconAnomaly), anomalies)
+    if baseline_rows:
+        db.execute(insert(AnomalyBaseline), baseline_rows)
+    db.commit()
+    logger.info(f"Anomaly rebuild: {n_props} properties x {n_months} months, {len(anomalies)} anomalies")
+    return {"properties": n_props, "months": n_months, "anomalies": len(anomalies)}
+
+# ----------- CLI ------------
+def main(argv=None):
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Recompute variance baselines and anomalies from history.")
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        summary = rebuild_anomalies(db)
+    finally:
+        db.close()
+    print(f"{summary['anomalies']} anomalies across {summary['properties']} properties x {summary['months']} months")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,59 +4,97 @@ import pandas as pd
 import json
 import os
 
+API_URL = os.getenv("RECON_API_URL", "http://localhost:7860")
+# Same secret as the API's RECON_API_TOKEN (this client has no HF OAuth session)
+API_HEADERS = {"Authorization": f"Bearer {os.environ['RECON_API_TOKEN']}"} if os.getenv("RECON_API_TOKEN") else {}
+
+# Stages emitted by /reconcile/jobs/{id}/events, in order
+STAGE_LABELS = {
+    "joined": "🔗 Joined an identical run in progress",
+    "uploaded": "📤 Files uploaded",
+    "pages_parsed": "📄 Pages parsed",
+    "document_extracted": "🤖 Statement extracted",
+    "reconciled": "🧮 Reconciled",
+    "published": "💾 Month published",
+    "emailed": "📧 Email queued",
+    "done": "✅ Done",
+}
+
 st.set_page_config(page_title="Smart Partners Rental Recon", layout="wide")
 
 st.title("🏠 SmartPartners Reconciliation Dashboard")
 
+def stream_events(events_url):
+    """Yields parsed SSE events until the job reports done/error."""
+    with requests.get(f"{API_URL}{events_url}", stream=True, timeout=(10, 120)) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            if line and line.startswith("data:"):
+                event = json.loads(line[len("data:"):].strip())
+                yield event
+                if event["stage"] in ("done", "error"):
+                    return
+
 # --- STEP 1: UPLOAD SECTION ---
 with st.sidebar:
     st.header("Upload Documents")
-    pdf1 = st.file_uploader("Upload PDF Statement 1", type=["pdf"])
-    pdf2 = st.file_uploader("Upload PDF Statement 2", type=["pdf"])
-    bank_json = st.file_uploader("Upload Baselane JSON", type=["json"])
+    statement_pdfs = st.file_uploader("Upload Statement PDFs (any manager)", type=["pdf"], accept_multiple_files=True)
+    bank_file = st.file_uploader("Upload Baselane Export", type=["csv", "xlsx", "json"])
+    month_year = st.text_input("Reporting Month (YYYY-MM)", value=pd.Timestamp.today().strftime("%Y-%m"))
     
     run_btn = st.button("🚀 Run Reconciliation", type="primary")
 
 # --- STEP 2: RECONCILIATION LOGIC ---
 if run_btn:
-    if not (pdf1 and pdf2 and bank_json):
-        st.error("Please upload all three files first!")
+    if not (statement_pdfs and bank_file):
+        st.error("Please upload the statements and the bank export first!")
     else:
-        with st.spinner("Processing with LLM and comparing data..."):
-            # Prepare files for the FastAPI backend
-            files = {
-                "pdf1": (pdf1.name, pdf1.getvalue(), "application/pdf"),
-                "pdf2": (pdf2.name, pdf2.getvalue(), "application/pdf"),
-                "sheet_json": (bank_json.name, bank_json.getvalue(), "application/json"),
-            }
-            
-            # Since Streamlit and FastAPI run in the same Space, 
-            # we point to the local FastAPI port (usually 7860)
-            try:
-                response = requests.post("http://localhost:7860/reconcile", files=files)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    results = data.get("reconciliation_result", [])
-                    
-                    st.success("Reconciliation Complete!")
-                    
-                    # Display as a nice Table
-                    df = pd.DataFrame(results)
-                    st.table(df)
-                    
-                    # Highlighting discrepancies
-                    if "Discrepancy" in df['status'].values:
-                        st.warning("⚠️ Discrepancies found! Check the table above.")
-                else:
-                    st.error(f"Error: {response.text}")
-            except Exception as e:
-                st.error(f"Connection failed: {e}")
+        # Prepare files for the FastAPI backend
+        files = [("statements", (pdf.name, pdf.getvalue(), "application/pdf")) for pdf in statement_pdfs]
+        files.append(("sheet_json", (bank_file.name, bank_file.getvalue(), bank_file.type or "application/octet-stream")))
+
+        # Since Streamlit and FastAPI run in the same Space, 
+        # we point to the local FastAPI port (usually 7860)
+        try:
+            start = requests.post(
+                f"{API_URL}/reconcile/jobs", files=files, data={"month_year": month_year},
+                headers=API_HEADERS, timeout=60
+            )
+            if start.status_code == 429:
+                st.warning(f"The server is busy with other reconciliations. Try again in {start.headers.get('Retry-After', '30')} seconds.")
+            elif start.status_code != 202:
+                st.error(f"Error: {start.text}")
+            else:
+                job = start.json()
+                total_steps = len(statement_pdfs) * 2 + 5
+                progress = st.progress(0.0)
+                with st.status("Reconciling...", expanded=True) as status:
+                    for step, event in enumerate(stream_events(job["events_url"]), start=1):
+                        label = STAGE_LABELS.get(event["stage"], event["stage"])
+                        detail = event.get("file") or event.get("details") or ""
+                        st.write(f"{label} {detail} — {event['elapsed']:.1f}s")
+                        progress.progress(min(step / total_steps, 1.0))
+
+                        if event["stage"] == "error":
+                            status.update(label=f"❌ {event.get('error')}", state="error")
+                        elif event["stage"] == "done":
+                            progress.progress(1.0)
+                            status.update(label="Reconciliation Complete!", state="complete")
+
+                            # Display as a nice Table (read from the primary: the replica may not have the month yet)
+                            details = requests.get(
+                                f"{API_URL}/report/details", params={"month_year": month_year, "primary": "1"}, timeout=30
+                            )
+                            if details.status_code == 200:
+                                st.table(pd.DataFrame(details.json().get("data", [])))
+                            st.markdown(f"[Open the full report]({API_URL}{event['report_url']})")
+        except Exception as e:
+            st.error(f"Connection failed: {e}")
 
 # --- STEP 3: HISTORY SECTION (From Neon) ---
 st.divider()
-st.subheader("Last 10 Processed Properties (from Neon DB)")
+st.subheader("Last Processed Properties (from Neon DB)")
 if st.button("🔄 Refresh History"):
-    history_resp = requests.get("http://localhost:7860/history")
+    history_resp = requests.get(f"{API_URL}/report/details", params={"month_year": month_year})
     if history_resp.status_code == 200:
-        st.json(history_resp.json())
\ No newline at end of file
+        st.json(history_resp.json())
@@ -0,0 +1,228 @@
+"""
+Multi-month historical backfill.
+
+    python -m app.backfill --statements ./statements --bank baselane_2025.csv --bank baselane_2026.xlsx
+
+Extracts every statement PDF in the directory, groups statements and bank
+rows by month and reconciles the months in parallel across a process pool.
+Extractions are stored in the document registry and finished months are
+skipped on the next run, so an interrupted backfill can simply be re-run.
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import logging
+import multiprocessing as mp
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+from sqlalchemy import distinct
+
+from app import models
+from app.anomaly import rebuild_anomalies
+from app.database import SessionLocal, engine
+from app.documents import file_sha256, get_documents, remember_statement
+from app.ingest import BANK_COLUMNS, read_bank_export
+from app.llm import set_llm_limiter
+from app.managers import get_manager
+from app.pipeline import ParsedStatement, StatementFile, extract_statement, merged_properties, normalize_doc, statement_rows
+from app.reconcile import run_reconciliation
+from app.utils import parse_any_date
+
+logger = logging.getLogger("backfill")
+
+# ----------- Worker process setup ------------
+def _init_worker(llm_semaphore):
+    # Each worker gets its own connections; the semaphore caps LLM calls across all workers
+    engine.dispose(close=False)
+    set_llm_limiter(llm_semaphore)
+
+def _extract_worker(path: str):
+    content = Path(path).read_bytes()
+    return extract_statement(StatementFile(filename=os.path.basename(path), content=content))
+
+def _reconcile_worker(month_iso: str, statements, bank_rows, send_email: bool):
+    start = time.perf_counter()
+    target_month = parse_any_date(month_iso)
+    bank_df = pd.DataFrame(bank_rows, columns=BANK_COLUMNS)
+
+    db = SessionLocal()
+    try:
+        run_reconciliation(
+            db=db,
+            bank_df=bank_df,
+            extracted_props=merged_properties(statements),
+            target_month=target_month,
+            send_email=send_email,  # queued; the app's outbox sender mails one digest
+            statement_rows=statement_rows(statements)
+        )
+    finally:
+        db.close()
+    return month_iso, len(merged_properties(statements)), time.perf_counter() - start
+
+# ----------- Inputs ------------
+def load_bank_exports(paths):
+    """
+    All bank exports concatenated and split into {'YYYY-MM': rows}.
+    The same file passed twice (same content) is read once; repeated rows
+    are kept, since two identical same-day payments are real transactions.
+    """
+    unique_paths = {}
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(1 << 20), b""):
+                digest.update(block)
+        if digest.hexdigest() in unique_paths:
+            logger.warning(f"Skipping {path}: same content as {unique_paths[digest.hexdigest()]}")
+            continue
+        unique_paths[digest.hexdigest()] = path
+
+    # CSV / XLSX / JSON, each streamed from disk into the typed frame
+    frames = [read_bank_export(p) for p in unique_paths.values()]
+    bank_df = pd.concat(frames, ignore_index=True)
+
+    dates = bank_df["Date"]
+    undated = int(dates.isna().sum())
+    if undated:
+        logger.warning(f"Skipping {undated} bank rows with unreadable dates")
+
+    bank_df = bank_df[dates.notna()]
+    months = dates[dates.notna()].dt.strftime("%Y-%m")
+    return {month: rows.to_dict(orient="records") for month, rows in bank_df.groupby(months)}
+
+def extract_all(pdf_paths, pool):
+    """Registry hits are reused; only new PDFs go through the pool (and the LLM)."""
+    contents = {p: Path(p).read_bytes() for p in pdf_paths}
+    hashes = {p: file_sha256(c) for p, c in contents.items()}
+
+    db = SessionLocal()
+    try:
+        known = get_documents(db, list(hashes.values()))
+        parsed, misses = [], []
+        for path in pdf_paths:
+            cached = known.get(hashes[path])
+            manager = get_manager(cached.property_management) if cached is not None else None
+            if cached is not None and cached.extracted and manager is not None:
+                parsed.append(ParsedStatement(
+                    filename=os.path.basename(path),
+                    manager=manager,
+                    doc=normalize_doc(cached.extracted, manager),
+                    page_text=cached.page_text or "",
+                    cached=True
+                ))
+            else:
+                misses.append(path)
+
+        futures = {pool.submit(_extract_worker, path): path for path in misses}
+        failed = 0
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"Extraction failed for {path}: {e}")
+                continue
+            parsed.append(result)
+            if result.doc.properties:
+                remember_statement(db, hashes[path], result.filename, result.manager.name, result.page_text, result.doc.model_dump())
+                # Checkpoint each extraction so an interrupted run doesn't pay for it again
+                db.commit()
+        return parsed, len(misses) - failed, failed
+    finally:
+        db.close()
+
+def reconciled_months(db):
+    rows = db.query(distinct(models.PropertyReconLog.month_year)).all()
+    return {row[0].strftime("%Y-%m") for row in rows}
+
+# ----------- Main ------------
+def run_backfill(statements_dir, bank_paths, workers, llm_concurrency, force=False, send_email=True):
+    started = time.perf_counter()
+    pdf_paths = sorted(str(p) for p in Path(statements_dir).rglob("*") if p.suffix.lower() == ".pdf")
+    bank_by_month = load_bank_exports(bank_paths)
+    logger.info(f"{len(pdf_paths)} statement PDFs, bank rows for {len(bank_by_month)} months")
+
+    ctx = mp.get_context("spawn")
+    llm_semaphore = ctx.BoundedSemaphore(llm_concurrency)
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=(llm_semaphore,)) as pool:
+        # Phase 1: extraction
+        parsed, extracted_count, extract_failed = extract_all(pdf_paths, pool)
+        extract_seconds = time.perf_counter() - started
+
+        statements_by_month = defaultdict(list)
+        undated = 0
+        for p in parsed:
+            try:
+                statement_date = parse_any_date(p.doc.statement_date)
+            except ValueError as e:
+                undated += 1
+                logger.error(f"{p.filename}: {e}")
+                continue
+            statements_by_month[statement_date.strftime("%Y-%m")].append(p)
+
+        # Phase 2: reconcile every month that has statements (resume: skip finished months)
+        db = SessionLocal()
+        try:
+            done = set() if force else reconciled_months(db)
+        finally:
+            db.close()
+
+        months = sorted(m for m in statements_by_month if m not in done)
+        skipped = len(statements_by_month) - len(months)
+        futures = {
+            pool.submit(_reconcile_worker, month, statements_by_month[month], bank_by_month.get(month, []), send_email): month
+            for month in months
+        }
+
+        reconciled, reconcile_failed, properties = 0, 0, 0
+        for future in as_completed(futures):
+            month = futures[future]
+            try:
+                _, prop_count, seconds = future.result()
+            except Exception as e:
+                reconcile_failed += 1
+                logger.error(f"Reconciliation failed for {month}: {e}")
+                continue
+            reconciled += 1
+            properties += prop_count
+            logger.info(f"✅ {month}: {prop_count} properties in {seconds:.1f}s")
+
+    # Months were reconciled in parallel and out of order; replay anomaly baselines in month order
+    if reconciled:
+        db = SessionLocal()
+        try:
+            anomalies = rebuild_anomalies(db)["anomalies"]
+        finally:
+            db.close()
+        logger.info(f"Anomaly baselines rebuilt, {anomalies} anomalies flagged")
+
+    elapsed = time.perf_counter() - started
+    print("\n--- Backfill summary ---")
+    print(f"Statements: {len(pdf_paths)} ({len(pdf_paths) - extracted_count - extract_failed} cached, {extracted_count} extracted, {extract_failed} failed, {undated} without a usable date) in {extract_seconds:.1f}s")
+    print(f"Months: {reconciled} reconciled, {skipped} already done, {reconcile_failed} failed")
+    print(f"Elapsed: {elapsed:.1f}s | {reconciled / elapsed * 60:.1f} months/min | {properties / elapsed * 60:.1f} properties/min")
+    return reconcile_failed == 0 and extract_failed == 0 and undated == 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill reconciliation for many months at once.")
+    parser.add_argument("--statements", required=True, help="Directory of statement PDFs (searched recursively)")
+    parser.add_argument("--bank", required=True, action="append", help="Baselane export: CSV, XLSX or JSON (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Worker processes")
+    parser.add_argument("--llm-concurrency", type=int, default=2, help="Max concurrent LLM calls across all workers")
+    parser.add_argument("--force", action="store_true", help="Re-reconcile months that already have results")
+    parser.add_argument("--no-email", action="store_true", help="Don't queue report emails for the backfilled months")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    ok = run_backfill(args.statements, args.bank, args.workers, args.llm_concurrency, force=args.force, send_email=not args.no_email)
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import re
+import logging
+from functools import lru_cache
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Bank row categories
+MANAGER_DEPOSIT = "manager"
+HOA = "hoa"
+MORTGAGE = "mortgage"
+PROPERTY = "property"
+MISC = "misc"
+
+# Plain substring, as the original per-row check ("XYZHOA MGMT" is an HOA payment)
+HOA_PATTERN = r"HOA|homeowners?\s+assoc"
+MORTGAGE_PATTERN = r"mortgage"
+NEVER_MATCHES = r"(?!)"
+
+# ----------- Pattern building ------------
+def _trie_regex(words: Iterable[str]) -> str:
+    """
+    Compiles a set of literals into one prefix-trie regex, e.g. {2560, 2561, 407}
+    -> (?:256(?:0|1)|407). The regex engine then walks shared prefixes once
+    instead of trying every alternative, which keeps hundreds of house numbers cheap.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}  # end of word
+
+    def _build(node):
+        if "" in node and len(node) == 1:
+            return ""
+        alternatives = [re.escape(ch) + _build(child) for ch, child in sorted(node.items()) if ch != ""]
+        optional = "" in node
+        if len(alternatives) == 1 and not optional:
+            return alternatives[0]
+        group = "(?:" + "|".join(alternatives) + ")"
+        return group + "?" if optional else group
+
+    return _build(trie) if trie else NEVER_MATCHES
+
+class TransactionClassifier:
+    """
+    Labels every bank row in one pass per column:
+      - Description -> house number of a portfolio property (digit-anchored, so 407 != 14075)
+      - Merchant    -> manager deposit / HOA / mortgage (one vectorized match per category)
+    Category precedence, resolved per row: manager > hoa > mortgage > property > misc.
+    """
+
+    def __init__(self, house_numbers: Iterable[str], manager_aliases: Iterable[str]):
+        house_numbers = sorted({h for h in house_numbers if h})
+        manager_aliases = sorted({a for a in manager_aliases if a}, key=len, reverse=True)
+
+        self.house_regex = re.compile(r"(?<!\d)(" + _trie_regex(house_numbers) + r")(?!\d)")
+        manager_alt = "|".join(re.escape(a) for a in manager_aliases) or NEVER_MATCHES
+        # Separate patterns (not one alternation) so a row matching several categories
+        # gets the highest-precedence one, not whichever matched leftmost in the string
+        self.merchant_patterns = {
+            MANAGER_DEPOSIT: re.compile(manager_alt, re.IGNORECASE),
+            HOA: re.compile(HOA_PATTERN, re.IGNORECASE),
+            MORTGAGE: re.compile(MORTGAGE_PATTERN, re.IGNORECASE),
+        }
+
+    def label(self, bank_df: pd.DataFrame) -> pd.DataFrame:
+        """Returns a copy of bank_df with 'house_num' and 'category' columns."""
+        labeled = bank_df.copy()
+        description = labeled["Description"].fillna("").astype(str)
+        merchant = labeled["Merchant"].fillna("").astype(str)
+
+        labeled["house_num"] = description.str.extract(self.house_regex, expand=False)
+        hits = {name: merchant.str.contains(pattern).to_numpy() for name, pattern in self.merchant_patterns.items()}
+
+        # First true condition wins, in precedence order
+        labeled["category"] = np.select(
+            [hits[MANAGER_DEPOSIT], hits[HOA], hits[MORTGAGE], labeled["house_num"].notna().to_numpy()],
+            [MANAGER_DEPOSIT, HOA, MORTGAGE, PROPERTY],
+            default=MISC
+        ).astype(object)
+        return labeled
+
+@lru_cache(maxsize=8)
+def _cached_classifier(house_numbers: tuple, manager_aliases: tuple) -> TransactionClassifier:
+    logger.info(f"Compiling transaction classifier for {len(house_numbers)} properties")
+    return TransactionClassifier(house_numbers, manager_aliases)
+
+def get_classifier(house_numbers: Iterable[str], manager_aliases: Iterable[str]) -> TransactionClassifier:
+    """Compiled once per parameter set; a new parameter upload yields a new key."""
+    return _cached_classifier(tuple(sorted(set(house_numbers))), tuple(sorted(set(manager_aliases))))
@@ -0,0 +1,178 @@
+import os
+import math
+import time
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+
+from app.database import DB_CONNECT_TIMEOUT, engine
+from app.documents import file_sha256
+
+logger = logging.getLogger(__name__)
+
+# Reconciles allowed to run at once (each one holds LLM calls + a DB connection)
+RECONCILE_MAX_CONCURRENT = int(os.getenv("RECONCILE_MAX_CONCURRENT", "2"))
+# Extra reconciles allowed to wait for a slot before new submissions get a 429
+RECONCILE_MAX_QUEUED = int(os.getenv("RECONCILE_MAX_QUEUED", "4"))
+# Retry-After hint until we've timed a few real runs
+RECONCILE_RETRY_AFTER_SECONDS = int(os.getenv("RECONCILE_RETRY_AFTER_SECONDS", "30"))
+MONTH_LOCK_POLL_SECONDS = 0.5
+
+class AdmissionFull(Exception):
+    """Every reconcile slot and queue position is taken; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too many reconciliations in progress, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+def submission_key(month: str, statement_files, bank_bytes: bytes) -> str:
+    """Same month + same files (in any order) = same submission."""
+    hashes: List[str] = sorted(file_sha256(s.content) for s in statement_files)
+    digest = hashlib.sha256()
+    for part in [month, file_sha256(bank_bytes), *hashes]:
+        digest.update(part.encode())
+    return digest.hexdigest()
+
+# ----------- Per-month lock ------------
+_month_locks: Dict[str, asyncio.Lock] = {}
+_lock_engine = None
+
+def _get_lock_engine():
+    """
+    Advisory locks live on their own small autocommit pool: a lock connection is
+    held for the whole reconcile (LLM calls included), so it mustn't take a slot
+    from the app pool or sit "idle in transaction" where timeouts would kill it.
+    One connection per reconcile slot (the lock is taken inside a slot).
+    """
+    global _lock_engine
+    if _lock_engine is None:
+        _lock_engine = create_engine(
+            engine.url,
+            isolation_level="AUTOCOMMIT",
+            pool_size=RECONCILE_MAX_CONCURRENT,
+            max_overflow=0,
+            pool_pre_ping=True,
+            connect_args={"connect_timeout": DB_CONNECT_TIMEOUT},
+        )
+    return _lock_engine
+
+def _advisory_key(month: str) -> int:
+    # pg advisory locks take a signed 64-bit key
+    return int.from_bytes(hashlib.sha256(f"reconcile:{month}".encode()).digest()[:8], "big", signed=True)
+
+@asynccontextmanager
+async def month_lock(month: str):
+    """
+    Only one reconcile publishes a given month at a time. On Postgres this is
+    an advisory lock, so it also holds across workers/replicas of the API;
+    on SQLite (single process) an asyncio lock is enough.
+    """
+    if engine.dialect.name != "postgresql":
+        lock = _month_locks.setdefault(month, asyncio.Lock())
+        async with lock:
+            yield
+        return
+
+    key = _advisory_key(month)
+    conn = await asyncio.to_thread(_get_lock_engine().connect)
+    try:
+        # Poll try-lock instead of blocking a worker thread on pg_advisory_lock
+        while not await asyncio.to_thread(
+            lambda: conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": key}).scalar()
+        ):
+            await asyncio.sleep(MONTH_LOCK_POLL_SECONDS)
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(
+                lambda: conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": key})
+            )
+    finally:
+        await asyncio.to_thread(conn.close)
+
+# ----------- Admission + single-flight ------------
+class Flight:
+    """One in-flight reconcile; every identical submission awaits the same task."""
+
+    def __init__(self, key: str, month: str):
+        self.key = key
+        self.month = month
+        self.task: Optional[asyncio.Task] = None
+        self.job = None  # set by /reconcile/jobs so followers can reuse its event stream
+
+class ReconcileGate:
+    def __init__(self, max_concurrent: int, max_queued: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._admitted = 0  # running + waiting for a slot
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._flights: Dict[str, Flight] = {}
+        self._avg_seconds: Optional[float] = None
+
+    def inflight(self, key: str) -> Optional[Flight]:
+        return self._flights.get(key)
+
+    def retry_after(self) -> int:
+        per_run = self._avg_seconds or RECONCILE_RETRY_AFTER_SECONDS
+        waves = (self._admitted - self.max_concurrent) // self.max_concurrent + 1
+        return max(1, math.ceil(per_run * max(waves, 1)))
+
+    def stats(self):
+        return {
+            "admitted": self._admitted,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "inflight_months": sorted({f.month for f in self._flights.values()}),
+            "avg_seconds": round(self._avg_seconds, 2) if self._avg_seconds else None,
+        }
+
+    def submit(self, key: str, month: str, work: Callable[[], Awaitable]) -> Flight:
+        """
+        Joins the identical in-flight submission if there is one; otherwise
+        admits a new run (raising AdmissionFull when slots and queue are taken).
+        Synchronous on purpose: check-and-register can't interleave with another
+        request on the event loop.
+        """
+        existing = self._flights.get(key)
+        if existing is not None:
+            logger.info(f"Joining in-flight reconcile for {month} ({key[:8]})")
+            return existing
+
+        if self._admitted >= self.max_concurrent + self.max_queued:
+            raise AdmissionFull(self.retry_after())
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        flight = Flight(key, month)
+        self._admitted += 1
+        self._flights[key] = flight
+        flight.task = asyncio.create_task(self._run(flight, work))
+        flight.task.add_done_callback(self._finished)
+        return flight
+
+    async def _run(self, flight: Flight, work):
+        try:
+            async with self._slots:
+                async with month_lock(flight.month):
+                    start = time.perf_counter()
+                    result = await work()
+                    self._record(time.perf_counter() - start)
+                    return result
+        finally:
+            self._admitted -= 1
+            self._flights.pop(flight.key, None)
+
+    def _record(self, seconds: float):
+        self._avg_seconds = seconds if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * seconds
+
+    @staticmethod
+    def _finished(task: asyncio.Task):
+        # Waiters get the exception; retrieve it here too so an abandoned flight isn't logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+reconcile_gate = ReconcileGate(RECONCILE_MAX_CONCURRENT, RECONCILE_MAX_QUEUED)
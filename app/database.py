@@ -1,30 +1,145 @@
 import os
-from sqlalchemy import create_engine
+import time
+import logging
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError, DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv  
 
 # Load variables from .env
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Get URL from HF Secrets
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional Neon read replica used by GET/report routes (falls back to the primary)
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+
+# Pool / timeout tuning (Neon free tier allows a limited number of connections)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))               # seconds to wait for a free connection
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))  # 0 disables the limit
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "10"))         # seconds, so a dead replica fails fast
+
+# Read/write routing
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "30"))  # stick to primary after a write
+REPLICA_RETRY_SECONDS = int(os.getenv("REPLICA_RETRY_SECONDS", "60"))        # back-off after replica failure
+STICKY_COOKIE = "recon_rw_sticky"
+# ?primary=1 pins one request to the primary (links handed out after a background write,
+# where there's no response to set the sticky cookie on)
+READ_PRIMARY_PARAM = "primary"
 
 # DEBUG: 
 if not SQLALCHEMY_DATABASE_URL:
     print("❌ ERROR: DATABASE_URL is not set in .env file!")
 
 # Fix for SQLAlchemy if the URL starts with 'postgres://' (common in cloud providers)
-if SQLALCHEMY_DATABASE_URL and SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
+def _normalize_url(url):
+    if url and url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+SQLALCHEMY_DATABASE_URL = _normalize_url(SQLALCHEMY_DATABASE_URL)
+DATABASE_READ_URL = _normalize_url(DATABASE_READ_URL)
+
+def _is_sqlite(url):
+    return bool(url) and url.startswith("sqlite")
+
+def _sync_engine_kwargs(url):
+    """Pool + statement timeout settings for the psycopg2 engine."""
+    if _is_sqlite(url):
+        return {"connect_args": {"check_same_thread": False}}
+
+    kwargs = {
+        "pool_pre_ping": True,  # Critical for Neon "Scale to Zero"
+        "pool_recycle": 300,    # Refreshes connections every 5 mins
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    connect_args = {"connect_timeout": DB_CONNECT_TIMEOUT}
+    if DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    kwargs["connect_args"] = connect_args
+    return kwargs
+
+def without_statement_timeout(conn):
+    """
+    Lifts DB_STATEMENT_TIMEOUT_MS for the rest of the current transaction
+    (SET LOCAL), for startup migrations and backfills whose statements are
+    meant to run long. Takes a Connection or a Session; no-op off Postgres.
+    """
+    bind = conn.get_bind() if isinstance(conn, Session) else conn
+    if bind.dialect.name == "postgresql":
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+
+# ----------- Async URL helpers ------------
+def to_async_url(url):
+    """
+    Maps a sync URL onto its async driver and returns (url, connect_args).
+    postgresql:// -> postgresql+asyncpg:// , sqlite:// -> sqlite+aiosqlite://
+    asyncpg does not understand libpq query params (sslmode, channel_binding),
+    so they are stripped from the URL and translated into connect_args.
+    """
+    if not url:
+        return url, {}
+
+    if _is_sqlite(url):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1), {}
+
+    parts = urlsplit(url)
+    scheme = "postgresql+asyncpg"
+    query = dict(parse_qsl(parts.query))
+    connect_args = {"timeout": DB_CONNECT_TIMEOUT}
+
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = "require"
+
+    if DB_STATEMENT_TIMEOUT_MS:
+        connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+
+    async_url = urlunsplit((scheme, parts.netloc, parts.path, urlencode(query), parts.fragment))
+    return async_url, connect_args
+
+def _async_engine_kwargs(url, connect_args):
+    if _is_sqlite(url):
+        return {}
+    return {
+        "pool_pre_ping": True,
+        "pool_recycle": 300,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "connect_args": connect_args,
+    }
+
+def _make_engines(url):
+    """Builds the (sync, async) engine pair for one database URL."""
+    sync_engine = create_engine(url, **_sync_engine_kwargs(url))
+    async_url, async_connect_args = to_async_url(url)
+    return sync_engine, create_async_engine(async_url, **_async_engine_kwargs(async_url, async_connect_args))
+
+# Primary (read/write)
+engine, async_engine = _make_engines(SQLALCHEMY_DATABASE_URL)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    pool_pre_ping=True,  # Critical for Neon "Scale to Zero"
-    pool_recycle=300     # Refreshes connections every 5 mins
-)
+# Replica (read-only) - same engines as the primary when no replica is configured
+if DATABASE_READ_URL:
+    read_engine, async_read_engine = _make_engines(DATABASE_READ_URL)
+else:
+    read_engine, async_read_engine = engine, async_engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 # Dependency to get DB session in routes
@@ -33,4 +148,79 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Async dependency for the async route handlers (doesn't block the event loop)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# ----------- Read/Write session routing ------------
+_replica_down_until = 0.0
+
+def mark_recent_write(response):
+    """
+    Read-your-writes: after a write, pin this browser to the primary for a
+    short window so the redirect (e.g. /reconcile -> /report) sees fresh rows
+    even if the replica is lagging.
+    """
+    response.set_cookie(STICKY_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax")
+    return response
+
+def _mark_replica_down(error):
+    global _replica_down_until
+    _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+    logger.warning(f"Read replica unavailable, using primary for {REPLICA_RETRY_SECONDS}s: {error}")
+
+def _replica_available():
+    return bool(DATABASE_READ_URL) and time.monotonic() >= _replica_down_until
+
+def _use_replica(request: Request):
+    if not _replica_available():
+        return False
+    if request.query_params.get(READ_PRIMARY_PARAM) == "1":
+        return False
+    return STICKY_COOKIE not in request.cookies
+
+# Dependency for read-only (GET) routes on the async path
+async def get_async_read_db(request: Request):
+    db = None
+    if _use_replica(request):
+        db = AsyncReadSessionLocal()
+        try:
+            await db.execute(text("SELECT 1"))
+        except (OperationalError, DBAPIError, OSError, TimeoutError) as e:
+            await db.close()
+            _mark_replica_down(e)
+            db = None
+
+    if db is None:
+        db = AsyncSessionLocal()
+    try:
+        yield db
+    finally:
+        await db.close()
+
+def open_read_session(use_replica: bool = True):
+    """
+    Sync read session: the replica if it answers, else the primary (and the
+    replica is skipped for REPLICA_RETRY_SECONDS). For code outside a request
+    (exports, CLIs); the caller closes it.
+    """
+    if use_replica and _replica_available():
+        db = ReadSessionLocal()
+        try:
+            db.execute(text("SELECT 1"))
+            return db
+        except (OperationalError, DBAPIError, OSError) as e:
+            db.close()
+            _mark_replica_down(e)
+    return SessionLocal()
+
+# Dependency for read-only routes that are still sync (e.g. CSV export)
+def get_read_db(request: Request):
+    db = open_read_session(_use_replica(request))
+    try:
+        yield db
+    finally:
+        db.close()
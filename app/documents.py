@@ -0,0 +1,71 @@
+import json
+import hashlib
+import logging
+from typing import Dict, List
+
+import pandas as pd
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import UploadedDocument
+from app.ingest import BANK_COLUMNS, normalize_bank_frame, read_bank_export
+
+logger = logging.getLogger(__name__)
+
+# Registry of previously-seen uploads, keyed by SHA-256 of the raw bytes.
+# A re-run with the same files skips PDF parsing, LLM extraction and bank export parsing.
+
+def file_sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+def get_documents(db: Session, hashes: List[str]) -> Dict[str, UploadedDocument]:
+    """One query for every hash in the upload."""
+    if not hashes:
+        return {}
+    rows = db.query(UploadedDocument).filter(UploadedDocument.sha256.in_(set(hashes))).all()
+    return {row.sha256: row for row in rows}
+
+def _remember(db: Session, sha256: str, **values):
+    """
+    Insert-or-update by sha256. A row may already exist (a cached statement whose
+    manager left the registry is extracted again), or a reconcile for another
+    month may be storing the same bytes right now; either way the row is updated.
+    """
+    row = db.query(UploadedDocument).filter(UploadedDocument.sha256 == sha256).one_or_none()
+    if row is None:
+        try:
+            with db.begin_nested():
+                db.add(UploadedDocument(sha256=sha256, **values))
+            return
+        except IntegrityError:
+            # Lost the race: the other insert committed first
+            row = db.query(UploadedDocument).filter(UploadedDocument.sha256 == sha256).one()
+    for key, value in values.items():
+        setattr(row, key, value)
+
+def remember_statement(db: Session, sha256: str, filename: str, manager_name: str, page_text: str, extracted: dict):
+    _remember(
+        db, sha256,
+        kind="statement",
+        filename=filename,
+        property_management=manager_name,
+        page_text=page_text,
+        extracted=extracted
+    )
+
+def remember_bank(db: Session, sha256: str, filename: str, bank_df: pd.DataFrame):
+    # to_json handles numpy scalars / NaN, json.loads gives plain python for the JSON column
+    rows = json.loads(bank_df.to_json(orient="records", date_format="iso"))
+    _remember(db, sha256, kind="bank", filename=filename, bank_rows=rows)
+
+# ----------- Bank export (cached) ------------
+def load_bank_frame(db: Session, filename: str, content: bytes) -> pd.DataFrame:
+    sha256 = file_sha256(content)
+    cached = get_documents(db, [sha256]).get(sha256)
+    if cached is not None and cached.bank_rows is not None:
+        logger.info(f"Bank export {filename} already seen, skipping parse")
+        return normalize_bank_frame(pd.DataFrame(cached.bank_rows, columns=BANK_COLUMNS))
+
+    bank_df = read_bank_export(content, filename)
+    remember_bank(db, sha256, filename, bank_df)
+    return bank_df
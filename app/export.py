@@ -0,0 +1,219 @@
+"""
+Columnar export of statements, recon logs and misc expenses.
+
+    GET /export/columnar?table=recon&start=2024-01&end=2026-12&format=parquet
+
+or, for repeated analyses, a local memory-mapped cache that only touches
+the database for months it hasn't seen:
+
+    from app.export import load_cached
+    df = load_cached("recon", "2022-01", "2026-12").to_pandas()
+
+    python -m app.export --table recon --start 2022-01 --end 2026-12 [--refresh] [--out recon.parquet]
+"""
+import os
+import sys
+import argparse
+import logging
+from decimal import Decimal
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Date, DateTime, Integer, JSON, Numeric, select
+
+from app.database import open_read_session
+from app.models import RentalStatement, PropertyReconLog, MiscExpenseLog
+from app.money import to_cents
+from app.partitions import month_bounds
+from app.utils import parse_any_date
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "5000"))
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "export_cache")
+
+# export name -> (model, month column)
+EXPORT_TABLES = {
+    "statements": (RentalStatement, "statement_date"),
+    "recon": (PropertyReconLog, "month_year"),
+    "misc": (MiscExpenseLog, "month_year"),
+}
+MONEY_TYPE = pa.decimal128(12, 2)
+
+# ----------- Schema ------------
+def _arrow_type(column):
+    if isinstance(column.type, Numeric):
+        return MONEY_TYPE
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Date):
+        return pa.date32()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    return pa.string()
+
+def arrow_schema(model) -> pa.Schema:
+    return pa.schema([pa.field(c.name, _arrow_type(c)) for c in model.__table__.columns])
+
+def _money_array(values) -> pa.Array:
+    """Exact decimal(12,2) from the float column values, via integer cents."""
+    missing = [v is None for v in values]
+    cents = to_cents([0.0 if m else v for v, m in zip(values, missing)])
+    return pa.array(
+        [None if m else Decimal(int(c)).scaleb(-2) for c, m in zip(cents, missing)],
+        type=MONEY_TYPE
+    )
+
+def _to_record_batch(rows, model, schema) -> pa.RecordBatch:
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    arrays = []
+    for field, column, values in zip(schema, model.__table__.columns, columns):
+        values = list(values)
+        if field.type == MONEY_TYPE:
+            arrays.append(_money_array(values))
+        elif isinstance(column.type, JSON):
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+# ----------- Batched reads ------------
+def iter_batches(db, table: str, start_month, end_month):
+    """Yields RecordBatches of at most EXPORT_BATCH_ROWS rows (server-side cursor, bounded memory)."""
+    model, month_col = EXPORT_TABLES[table]
+    schema = arrow_schema(model)
+    start, _ = month_bounds(start_month)
+    _, end = month_bounds(end_month)
+    col = getattr(model, month_col)
+
+    stmt = (
+        select(*model.__table__.columns)
+        .where(col >= start, col < end)
+        .order_by(col, model.id)
+        .execution_options(yield_per=EXPORT_BATCH_ROWS)
+    )
+    for rows in db.execute(stmt).partitions():
+        yield _to_record_batch(rows, model, schema)
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the response generator."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def stream_export(table: str, start_month, end_month, fmt: str = "parquet"):
+    """Generator of file bytes for a StreamingResponse: one row group / IPC batch per DB batch."""
+    model, _ = EXPORT_TABLES[table]
+    schema = arrow_schema(model)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema) if fmt == "parquet" else pa.ipc.new_stream(sink, schema)
+
+    db = open_read_session()
+    try:
+        for batch in iter_batches(db, table, start_month, end_month):
+            if fmt == "parquet":
+                writer.write_table(pa.Table.from_batches([batch], schema=schema))
+            else:
+                writer.write_batch(batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+        writer.close()
+        yield sink.drain()
+    finally:
+        db.close()
+
+# ----------- Local memory-mapped cache ------------
+def _months(start_month, end_month):
+    current, _ = month_bounds(start_month)
+    last, _ = month_bounds(end_month)
+    while current <= last:
+        yield current
+        _, current = month_bounds(current)
+
+def _cache_path(cache_dir, table, month) -> Path:
+    return Path(cache_dir) / table / f"{month:%Y-%m}.arrow"
+
+def cache_months(table: str, start_month, end_month, cache_dir: str = EXPORT_CACHE_DIR, refresh: bool = False):
+    """Writes one Arrow IPC file per month that isn't cached yet (or every month with refresh)."""
+    model, _ = EXPORT_TABLES[table]
+    schema = arrow_schema(model)
+    paths, missing = [], []
+    for month in _months(start_month, end_month):
+        path = _cache_path(cache_dir, table, month)
+        paths.append(path)
+        if refresh or not path.exists():
+            missing.append((month, path))
+
+    if missing:
+        db = open_read_session()
+        try:
+            for month, path in missing:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_suffix(".tmp")
+                with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                    for batch in iter_batches(db, table, month, month):
+                        writer.write_batch(batch)
+                os.replace(tmp_path, path)  # never leave a half-written month in the cache
+        finally:
+            db.close()
+        logger.info(f"Cached {len(missing)} month(s) of {table} in {cache_dir}")
+    return paths
+
+def load_cached(table: str, start_month, end_month, cache_dir: str = EXPORT_CACHE_DIR, refresh: bool = False) -> pa.Table:
+    """
+    Memory-maps the cached month files (zero-copy) and returns one Arrow table.
+    Re-run with refresh=True for months that have been re-reconciled since caching.
+    """
+    start_month, end_month = _as_month(start_month), _as_month(end_month)
+    paths = cache_months(table, start_month, end_month, cache_dir, refresh)
+    tables = [pa.ipc.open_file(pa.memory_map(str(p), "r")).read_all() for p in paths]
+    return pa.concat_tables(tables) if tables else arrow_schema(EXPORT_TABLES[table][0]).empty_table()
+
+def _as_month(value):
+    return parse_any_date(value) if isinstance(value, str) else value
+
+# ----------- CLI ------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar export with a local month cache.")
+    parser.add_argument("--table", required=True, choices=sorted(EXPORT_TABLES))
+    parser.add_argument("--start", required=True, help="YYYY-MM")
+    parser.add_argument("--end", required=True, help="YYYY-MM")
+    parser.add_argument("--cache-dir", default=EXPORT_CACHE_DIR)
+    parser.add_argument("--refresh", action="store_true", help="Re-read cached months from the database")
+    parser.add_argument("--out", help="Also write the range to this .parquet file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    table = load_cached(args.table, args.start, args.end, args.cache_dir, args.refresh)
+    print(f"{args.table}: {table.num_rows} rows, {table.nbytes / 1e6:.1f} MB mapped from {args.cache_dir}")
+    if args.out:
+        pq.write_table(table, args.out)
+        print(f"Wrote {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
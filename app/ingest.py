@@ -0,0 +1,259 @@
+"""
+Bank export ingestion: CSV, XLSX or JSON in, one typed frame out.
+
+    Date         datetime64 (day precision; unreadable dates become NaT)
+    Merchant     str
+    Description  str
+    Amount       float64 (accepts "$1,234.50", "(12.00)", "-12")
+
+Only those four columns are ever materialized. Every format is read as a
+stream of rows and normalized INGEST_CHUNK_ROWS at a time, so a large
+export costs one pass and memory proportional to the kept columns.
+"""
+import io
+import os
+import json
+import codecs
+import logging
+from pathlib import Path
+from typing import Iterator, List, Union
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+BANK_COLUMNS = ["Date", "Merchant", "Description", "Amount"]
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "50000"))
+CSV_ENCODING_SAMPLE = 64 * 1024  # bytes decoded up front to choose utf-8 vs latin1
+JSON_SNIFF_SAMPLE = 64 * 1024    # bytes read up front to tell JSON Lines from one document
+
+_WANTED = {c.lower(): c for c in BANK_COLUMNS}
+
+class BankExportError(ValueError):
+    pass
+
+# ----------- Normalization ------------
+def _header_map(columns) -> dict:
+    """Source column -> canonical name, matching case/whitespace-insensitively."""
+    mapping = {}
+    for col in columns:
+        canonical = _WANTED.get(str(col).strip().lower())
+        if canonical and canonical not in mapping.values():
+            mapping[col] = canonical
+    return mapping
+
+def _parse_amount(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype("float64")
+    text = values.astype(str).str.strip()
+    negative = text.str.startswith("(") & text.str.endswith(")")
+    cleaned = text.str.replace(r"[,$()\s]", "", regex=True)
+    amounts = pd.to_numeric(cleaned, errors="coerce")
+    return amounts.where(~negative, -amounts).astype("float64")
+
+# pandas >= 2 infers one format from the first value; "mixed" parses element-wise
+_MIXED_DATES = {"format": "mixed"} if int(pd.__version__.split(".")[0]) >= 2 else {}
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize()
+    dates = pd.to_datetime(values, errors="coerce")
+    # Fast inferred pass first; only values that didn't fit that format pay for the slow parse
+    retry = dates.isna() & values.notna() & (values.astype(str).str.strip() != "")
+    if retry.any():
+        dates[retry] = pd.to_datetime(values[retry], errors="coerce", **_MIXED_DATES)
+    return dates.dt.normalize()
+
+def normalize_bank_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Any frame with (some spelling of) the bank columns -> the typed frame."""
+    df = df.rename(columns=_header_map(df.columns))
+    missing = [c for c in BANK_COLUMNS if c not in df.columns]
+    if missing:
+        raise BankExportError(f"Bank export is missing column(s): {', '.join(missing)}")
+
+    out = pd.DataFrame(index=df.index)
+    out["Date"] = _parse_dates(df["Date"])
+    out["Merchant"] = df["Merchant"].fillna("").astype(str).str.strip()
+    out["Description"] = df["Description"].fillna("").astype(str).str.strip()
+    out["Amount"] = _parse_amount(df["Amount"]).fillna(0.0)
+    return out.reset_index(drop=True)
+
+def _empty_frame() -> pd.DataFrame:
+    return normalize_bank_frame(pd.DataFrame(columns=BANK_COLUMNS))
+
+# ----------- Format sniffing ------------
+def sniff_format(head: bytes, filename: str = "") -> str:
+    if head.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    if head.startswith(b"\xd0\xcf\x11\xe0"):
+        return "xls"
+    stripped = head.lstrip(codecs.BOM_UTF8).lstrip()
+    if stripped[:1] in (b"[", b"{"):
+        return "json"
+    suffix = Path(filename).suffix.lower()
+    if suffix in (".xlsx", ".xls", ".json"):
+        return suffix[1:]
+    return "csv"
+
+# ----------- Row streams, one per format ------------
+def _csv_encoding(fh) -> str:
+    """utf-8 unless the leading sample isn't; Excel "CSV" exports are often Latin-1."""
+    fh.seek(0)
+    sample = fh.read(CSV_ENCODING_SAMPLE)
+    fh.seek(0)
+    try:
+        # Incremental decoder: a multi-byte character cut at the sample edge isn't an error
+        codecs.getincrementaldecoder("utf-8-sig")().decode(sample, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        logger.info("Bank CSV is not utf-8, reading as latin1")
+        return "latin1"
+
+def _csv_chunks(fh) -> Iterator[pd.DataFrame]:
+    encoding = _csv_encoding(fh)
+    reader = pd.read_csv(
+        fh,
+        encoding=encoding,
+        # A stray invalid byte past the sample replaces one character instead of failing mid-stream
+        encoding_errors="replace",
+        usecols=lambda c: str(c).strip().lower() in _WANTED,
+        dtype=str,               # typed in normalize_bank_frame, never inferred per chunk
+        keep_default_na=False,
+        chunksize=INGEST_CHUNK_ROWS,
+    )
+    with reader:
+        for chunk in reader:
+            yield normalize_bank_frame(chunk)
+
+def _xlsx_chunks(fh) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        keep = {i: name for i, name in enumerate(header) if name is not None and str(name).strip().lower() in _WANTED}
+        chunk: List[tuple] = []
+        for row in rows:
+            if row is None or all(v is None for v in row):
+                continue
+            chunk.append(tuple(row[i] if i < len(row) else None for i in keep))
+            if len(chunk) >= INGEST_CHUNK_ROWS:
+                yield normalize_bank_frame(pd.DataFrame(chunk, columns=list(keep.values())))
+                chunk = []
+        if chunk or not keep:
+            yield normalize_bank_frame(pd.DataFrame(chunk, columns=list(keep.values())))
+    finally:
+        workbook.close()
+
+def _xls_chunks(fh) -> Iterator[pd.DataFrame]:
+    # Legacy binary Excel has no streaming reader; read only the columns we keep
+    df = pd.read_excel(fh, usecols=lambda c: str(c).strip().lower() in _WANTED)
+    yield normalize_bank_frame(df)
+
+def _is_json_lines(sample: bytes) -> bool:
+    """An object, then another value on a new line - judged on a bounded sample, never the whole file."""
+    text = codecs.getincrementaldecoder("utf-8-sig")(errors="ignore").decode(sample).lstrip()
+    if not text.startswith("{"):
+        return False
+    try:
+        _, end = json.JSONDecoder().raw_decode(text)
+    except ValueError:
+        # First object doesn't close within the sample: one (wrapper) document
+        return False
+    rest = text[end:]
+    following = rest.lstrip()
+    return bool(following) and "\n" in rest[:len(rest) - len(following)]
+
+def _records_prefix(fh) -> str:
+    """
+    ijson prefix of the first array whose first item is an object with a bank
+    column, so {"meta": {"tags": []}, "transactions": [...]} finds the transactions.
+    """
+    import ijson
+
+    fh.seek(0)
+    opened, item, keys = None, None, []
+    for path, event, value in ijson.parse(fh):
+        if item is not None:
+            if path == item and event == "map_key":
+                keys.append(value)
+            elif path == item and event == "end_map":
+                if _header_map(keys):
+                    return item
+                item = None
+            continue
+        if event == "start_map" and path == opened:
+            item, keys = path, []
+        opened = (f"{path}.item" if path else "item") if event == "start_array" else None
+    return "item"
+
+def _json_records(fh) -> Iterator[dict]:
+    """
+    Top-level array of records, an object wrapping one (e.g. {"transactions": [...]}),
+    or JSON Lines. Parsed incrementally with ijson.
+    """
+    import ijson
+
+    fh.seek(0)
+    if _is_json_lines(fh.read(JSON_SNIFF_SAMPLE)):
+        fh.seek(0)
+        for line in fh:
+            if line.strip():
+                yield json.loads(line)
+        return
+
+    prefix = _records_prefix(fh)
+    fh.seek(0)
+    yield from ijson.items(fh, prefix, use_float=True)
+
+def _json_chunks(fh) -> Iterator[pd.DataFrame]:
+    chunk: List[dict] = []
+    seen = set()
+    for record in _json_records(fh):
+        if not isinstance(record, dict):
+            continue
+        mapping = _header_map(record.keys())
+        seen.update(mapping.values())
+        chunk.append({canonical: record[source] for source, canonical in mapping.items()})
+        if len(chunk) >= INGEST_CHUNK_ROWS:
+            yield normalize_bank_frame(pd.DataFrame(chunk, columns=BANK_COLUMNS))
+            chunk = []
+    # Also raises when no record had any bank column (wrong file / empty export), never zero rows silently
+    missing = [c for c in BANK_COLUMNS if c not in seen]
+    if missing:
+        raise BankExportError(f"Bank export is missing column(s): {', '.join(missing)}")
+    yield normalize_bank_frame(pd.DataFrame(chunk, columns=BANK_COLUMNS))
+
+_READERS = {"csv": _csv_chunks, "xlsx": _xlsx_chunks, "xls": _xls_chunks, "json": _json_chunks}
+
+# ----------- Entry point ------------
+def read_bank_export(source: Union[bytes, str, Path], filename: str = "") -> pd.DataFrame:
+    """
+    Bytes (an upload) or a path (backfill) -> typed bank frame.
+    Paths are streamed from disk, never read whole.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        fh = io.BytesIO(source)
+    else:
+        filename = filename or str(source)
+        fh = open(source, "rb")
+
+    try:
+        fmt = sniff_format(fh.read(512), filename)
+        fh.seek(0)
+        # Each raw chunk is normalized and dropped as it is read: peak memory is the typed
+        # result plus one raw chunk, whatever the file size
+        chunks = list(_READERS[fmt](fh))
+    except BankExportError:
+        raise
+    except Exception as e:
+        raise BankExportError(f"Could not parse bank export {filename or ''}: {e}") from e
+    finally:
+        fh.close()
+
+    frame = pd.concat(chunks, ignore_index=True) if chunks else _empty_frame()
+    logger.info(f"Bank export {filename} ({fmt}): {len(frame)} rows")
+    return frame
@@ -0,0 +1,88 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_TTL_SECONDS = 3600  # finished jobs stay streamable for late/reconnecting clients
+TERMINAL_STAGES = ("done", "error")
+
+class ReconcileJob:
+    """
+    Progress of one reconcile run. emit() may be called from the event loop
+    or from worker threads (PDF parsing / LLM run in threads); subscribers
+    are woken on the loop either way.
+    """
+
+    def __init__(self, month: str, loop: asyncio.AbstractEventLoop):
+        self.id = uuid.uuid4().hex
+        self.month = month
+        self.started = time.perf_counter()
+        self.created_at = time.time()
+        self.events = []
+        self.finished = False
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self.task = None
+
+    def emit(self, stage: str, **data):
+        event = {"stage": stage, "elapsed": round(time.perf_counter() - self.started, 2), **data}
+        with self._lock:
+            self.events.append(event)
+            if stage in TERMINAL_STAGES:
+                self.finished = True
+        logger.info(f"[job {self.id[:8]}] {stage} {data}")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._changed.set()
+        else:
+            self._loop.call_soon_threadsafe(self._changed.set)
+
+    async def stream(self, keepalive_seconds: float = 15.0):
+        """Server-Sent Events: replays past events, then follows until done/error."""
+        sent = 0
+        while True:
+            # Clear before reading so an emit() racing with us still wakes the wait below
+            self._changed.clear()
+            with self._lock:
+                pending = self.events[sent:]
+                finished = self.finished
+            for event in pending:
+                yield f"event: {event['stage']}\ndata: {json.dumps(event, default=str)}\n\n"
+            sent += len(pending)
+            if finished and not pending:
+                return
+            if pending:
+                continue
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+
+class JobRegistry:
+    def __init__(self):
+        self._jobs: Dict[str, ReconcileJob] = {}
+
+    def create(self, month: str) -> ReconcileJob:
+        self._prune()
+        job = ReconcileJob(month, asyncio.get_running_loop())
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[ReconcileJob]:
+        return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [j.id for j in self._jobs.values() if j.finished and j.created_at < cutoff]:
+            del self._jobs[job_id]
+
+jobs = JobRegistry()
@@ -1,26 +1,66 @@
 import os
+import re
 import json
+import time
+import logging
+import textwrap
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from groq import Groq
+from pydantic import ValidationError
+from app.schemas import ExtractedDoc
 
-def extract_with_llm(text: str):
-    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-    
-    # We use 70B because it's significantly smarter than 8B for tables
-    model_id = "llama-3.3-70b-versatile"
+logger = logging.getLogger(__name__)
+
+# Prompt budgeting (rough estimate: ~4 characters per token for English/number-heavy text)
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", "6000"))
+LLM_CHUNK_WORKERS = int(os.getenv("LLM_CHUNK_WORKERS", "4"))
+CHARS_PER_TOKEN = 4
+
+# Extraction cascade: cheapest/fastest first, escalate to the next tier only if validation fails
+LLM_MODEL_CASCADE = [
+    m.strip() for m in os.getenv("LLM_MODEL_CASCADE", "llama-3.1-8b-instant,llama-3.3-70b-versatile").split(",")
+    if m.strip()
+]
+# Allowed gap between reported net and rent_paid - management_fees (rounding on statements)
+LLM_NET_TOLERANCE = float(os.getenv("LLM_NET_TOLERANCE", "0.05"))
+
+# Lines worth keeping even if they carry no digits (section headers, labels)
+KEEP_KEYWORDS = re.compile(
+    r"rent|fee|management|property|properties|address|statement|owner|tenant|"
+    r"paid|income|total|detail|unit|street|st\.|ave|road|rd\.|drive|dr\.|way|lane|ln\.|court|ct\.",
+    re.IGNORECASE
+)
+# Boilerplate that never carries property data
+DROP_PATTERNS = re.compile(
+    r"^page \d+( of \d+)?$|^printed on|^confidential|^www\.|https?://|@[\w.-]+\.\w+$|^phone|^fax|^tel",
+    re.IGNORECASE
+)
+
+# Page breaks: form feeds, or a "Page N of M" line (the PDF text itself joins pages with newlines)
+PAGE_MARKER = re.compile(r"^page \d+( of \d+)?$", re.IGNORECASE)
+# Lines at the top/bottom of a page that count as header/footer when repeated page to page
+PAGE_EDGE_LINES = 2
+
+# Used when the caller doesn't pass manager-specific rules (see app/managers.py)
+DEFAULT_PROMPT_RULES = (
+    "'property_management': set this to 'GOGO PROPERTY' for GOGO document and 'SURE REALTY' for the other one.",
+    "'address': set this to '2560 Coventry St.' for 'Management Detail Report' document",
+)
 
-    prompt = f"""
+PROMPT_TEMPLATE = """
     Return ONLY a valid JSON object. Extract rental data from the following text.
-    
+
     ### CRITICAL RULES:
-    - 'property_management': set this to 'GOGO PROPERTY' for GOGO document and 'SURE REALTY' for the other one.
-    - 'address': set this to '2560 Coventry St.' for 'Management Detail Report' document
- 
+{rules}
+
     SCHEMA:
     {{
       "statement_date": "MM/DD/YYYY",
       "property_management": str,
       "properties": [
-        {{ "address": "str", "rent_amount": 0.0, "rent_paid": 0.0, "management_fees": 0.0 }}
+        {{ "address": "str", "rent_amount": 0.0, "rent_paid": 0.0, "management_fees": 0.0, "net_income": 0.0 }}
       ]
     }}
 
@@ -28,10 +68,247 @@ def extract_with_llm(text: str):
     {text}
     """
 
-    chat_completion = client.chat.completions.create(
-        messages=[{"role": "user", "content": prompt}],
-        model=model_id,
-        response_format={"type": "json_object"} # Forces JSON
+# ----------- Prompt compaction ------------
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough for budgeting (no tokenizer dependency)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _pages(text: str):
+    """Whitespace-normalized, non-empty lines per page."""
+    pages = []
+    for page_text in text.split("\f"):
+        current = []
+        for raw_line in page_text.splitlines():
+            line = re.sub(r"\s+", " ", raw_line).strip()
+            if not line:
+                continue
+            current.append(line)
+            if PAGE_MARKER.match(line):
+                pages.append(current)
+                current = []
+        pages.append(current)
+    return [page for page in pages if page]
+
+def _edge_keys(page) -> dict:
+    """Line index -> (edge, offset from that edge, line) for a page's header and footer lines."""
+    last = len(page) - 1
+    keys = {}
+    for i, line in enumerate(page):
+        if i < PAGE_EDGE_LINES:
+            keys[i] = ("top", i, line)
+        elif last - i < PAGE_EDGE_LINES:
+            keys[i] = ("bottom", last - i, line)
+    return keys
+
+def compact_text(text: str) -> str:
+    """
+    Normalizes whitespace and drops lines that can't hold property/rent/fee data.
+    Keeps any line with a digit (amounts, dates, house numbers) or a keyword.
+    Page headers/footers (same line at the same spot near the top or bottom of
+    2+ pages) are kept on their first page only, so the statement period etc.
+    survive once.
+    """
+    pages = _pages(text)
+    counts = Counter(key for page in pages for key in set(_edge_keys(page).values()))
+    repeated = {key for key, n in counts.items() if n >= 2}
+
+    kept = []
+    shown = set()
+    previous = None
+    for page in pages:
+        edges = _edge_keys(page)
+        for i, line in enumerate(page):
+            key = edges.get(i)
+            if key in repeated:
+                if key in shown:
+                    continue
+                shown.add(key)
+            if DROP_PATTERNS.search(line):
+                continue
+            if not (any(ch.isdigit() for ch in line) or KEEP_KEYWORDS.search(line)):
+                continue
+            # Same line twice in a row (e.g. a label repeated by the PDF layout)
+            if line == previous:
+                continue
+            kept.append(line)
+            previous = line
+    return "\n".join(kept)
+
+def split_into_chunks(text: str, token_budget: int, rules=DEFAULT_PROMPT_RULES):
+    """
+    Splits on line boundaries so every chunk's prompt fits in the budget; a
+    single line longer than a chunk is hard-split (at spaces where possible).
+    """
+    overhead = estimate_tokens(_build_prompt("", rules))
+    chunk_budget = max(token_budget - overhead, 200)
+    max_line_chars = (chunk_budget - 1) * CHARS_PER_TOKEN
+
+    chunks, current, current_tokens = [], [], 0
+    lines = (piece for line in text.splitlines() for piece in (textwrap.wrap(line, max_line_chars) or [line]))
+    for line in lines:
+        line_tokens = estimate_tokens(line) + 1
+        if current and current_tokens + line_tokens > chunk_budget:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def merge_extractions(results):
+    """Merges per-chunk JSON: first non-empty header fields, properties de-duplicated by address."""
+    merged = {"statement_date": None, "property_management": None, "properties": []}
+    seen = set()
+    for result in results:
+        for key in ("statement_date", "property_management"):
+            if not merged[key] and result.get(key):
+                merged[key] = result[key]
+        for prop in result.get("properties") or []:
+            key = (str(prop.get("address", "")).strip().lower(), prop.get("rent_paid"), prop.get("management_fees"))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged["properties"].append(prop)
+    return merged
+
+# ----------- Output validation ------------
+def validate_extraction(parsed):
+    """Returns a list of problems; empty means the tier's answer is good enough to keep."""
+    try:
+        doc = ExtractedDoc(**parsed)
+    except (ValidationError, TypeError) as e:
+        return [f"schema: {e}"]
+
+    problems = []
+    if not doc.properties:
+        problems.append("no properties extracted")
+    if not doc.property_management or not doc.property_management.strip():
+        problems.append("missing property_management")
+
+    for prop in doc.properties:
+        if prop.rent_paid < 0 or prop.management_fees < 0:
+            problems.append(f"{prop.address}: negative amount")
+        if prop.rent_paid > 0 and prop.management_fees > prop.rent_paid:
+            problems.append(f"{prop.address}: management_fees exceed rent_paid")
+        # net_income is optional in the prompt; only check it when the model reported one
+        if prop.net_income and abs((prop.rent_paid - prop.management_fees) - prop.net_income) > LLM_NET_TOLERANCE:
+            problems.append(f"{prop.address}: rent_paid - management_fees != net_income")
+    return problems
+
+# ----------- Cascade metrics ------------
+_stats_lock = threading.Lock()
+_stats = {"documents": 0, "escalations": 0, "tiers": {}}
+
+def _tier_stats(model_id):
+    return _stats["tiers"].setdefault(
+        model_id, {"calls": 0, "accepted": 0, "rejected": 0, "total_seconds": 0.0, "tokens": 0}
     )
 
-    return json.loads(chat_completion.choices[0].message.content)
\ No newline at end of file
+def _record_tokens(model_id, usage):
+    if usage is None:
+        return
+    with _stats_lock:
+        _tier_stats(model_id)["tokens"] += getattr(usage, "total_tokens", 0) or 0
+
+def _record_tier(model_id, elapsed, accepted):
+    with _stats_lock:
+        tier = _tier_stats(model_id)
+        tier["calls"] += 1
+        tier["accepted" if accepted else "rejected"] += 1
+        tier["total_seconds"] += elapsed
+
+def get_cascade_stats():
+    """Per-tier latency and escalation rate, for tuning LLM_MODEL_CASCADE."""
+    with _stats_lock:
+        tiers = {}
+        for model_id, tier in _stats["tiers"].items():
+            tiers[model_id] = dict(tier, avg_seconds=round(tier["total_seconds"] / tier["calls"], 3) if tier["calls"] else 0.0)
+        documents = _stats["documents"]
+        return {
+            "documents": documents,
+            "escalations": _stats["escalations"],
+            "escalation_rate": round(_stats["escalations"] / documents, 3) if documents else 0.0,
+            "tiers": tiers,
+        }
+
+# ----------- Global LLM concurrency cap ------------
+# None = unlimited; the backfill CLI installs a cross-process semaphore here
+_llm_slots = None
+
+def set_llm_limiter(semaphore):
+    global _llm_slots
+    _llm_slots = semaphore
+
+# ----------- LLM call ------------
+def _format_rules(rules):
+    return "\n".join(f"    - {rule}" for rule in rules)
+
+def _build_prompt(text: str, rules) -> str:
+    return PROMPT_TEMPLATE.format(text=text, rules=_format_rules(rules))
+
+def _call_llm(text: str, model_id: str, rules=DEFAULT_PROMPT_RULES):
+    client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+    prompt = _build_prompt(text, rules)
+    logger.info(f"LLM prompt ~{estimate_tokens(prompt)} tokens ({model_id})")
+
+    if _llm_slots is not None:
+        _llm_slots.acquire()
+    try:
+        chat_completion = client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=model_id,
+            response_format={"type": "json_object"} # Forces JSON
+        )
+    finally:
+        if _llm_slots is not None:
+            _llm_slots.release()
+    _record_tokens(model_id, getattr(chat_completion, "usage", None))
+
+    return json.loads(chat_completion.choices[0].message.content)
+
+def _extract_with_model(compacted: str, model_id: str, token_budget: int, rules):
+    if estimate_tokens(_build_prompt(compacted, rules)) <= token_budget:
+        return _call_llm(compacted, model_id, rules)
+
+    # Long multi-property statement: extract chunks in parallel and merge
+    chunks = split_into_chunks(compacted, token_budget, rules)
+    logger.info(f"Prompt over budget ({token_budget} tokens), splitting into {len(chunks)} chunks")
+    with ThreadPoolExecutor(max_workers=min(LLM_CHUNK_WORKERS, len(chunks))) as pool:
+        results = list(pool.map(lambda chunk: _call_llm(chunk, model_id, rules), chunks))
+    return merge_extractions(results)
+
+def extract_with_llm(text: str, token_budget: int = None, rules=None):
+    token_budget = token_budget or LLM_PROMPT_TOKEN_BUDGET
+    rules = rules or DEFAULT_PROMPT_RULES
+    compacted = compact_text(text)
+    logger.info(f"Compacted statement text ~{estimate_tokens(text)} -> ~{estimate_tokens(compacted)} tokens")
+
+    with _stats_lock:
+        _stats["documents"] += 1
+
+    parsed = {}
+    for tier, model_id in enumerate(LLM_MODEL_CASCADE):
+        start = time.perf_counter()
+        try:
+            parsed = _extract_with_model(compacted, model_id, token_budget, rules)
+            problems = validate_extraction(parsed)
+        except Exception as e:
+            problems = [f"call failed: {e}"]
+        accepted = not problems
+        _record_tier(model_id, time.perf_counter() - start, accepted)
+
+        if accepted:
+            return parsed
+
+        is_last = tier == len(LLM_MODEL_CASCADE) - 1
+        if is_last:
+            logger.error(f"Extraction failed validation on final tier {model_id}: {problems}")
+        else:
+            logger.warning(f"Escalating from {model_id}: {problems}")
+            with _stats_lock:
+                _stats["escalations"] += 1
+
+    # Caller decides what to do with an invalid answer (same as before the cascade)
+    return parsed
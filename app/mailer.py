@@ -0,0 +1,206 @@
+import os
+import time
+import logging
+import smtplib
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import EmailOutbox
+from app.utils import render_reconciliation_email, smtp_server, smtp_port, sender, password, receiver
+
+logger = logging.getLogger(__name__)
+
+# Nothing pending: sleep until wake() or this long (also picks up rows queued by the backfill CLI).
+# Long on purpose, so an idle outbox doesn't keep the Neon compute from scaling to zero.
+OUTBOX_IDLE_SECONDS = int(os.getenv("OUTBOX_IDLE_SECONDS", "3600"))
+OUTBOX_POLL_SECONDS = int(os.getenv("OUTBOX_POLL_SECONDS", "30"))    # retry delay after a failed flush
+OUTBOX_BATCH_WINDOW = float(os.getenv("OUTBOX_BATCH_WINDOW", "5"))   # wait for more months before sending a digest
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "6"))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))  # doubles per attempt
+OUTBOX_BACKOFF_MAX = int(os.getenv("OUTBOX_BACKOFF_MAX", "3600"))
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", "20"))
+
+# ----------- Enqueue (inside the reconcile transaction) ------------
+def enqueue_reconciliation_email(db: Session, recon_logs, misc_logs, target_month) -> bool:
+    """
+    Renders once and queues; the caller's commit makes it visible to the sender.
+    Mail problems never fail the reconcile: a missing receiver or a failed
+    insert (own savepoint) is logged and the month publishes without an email.
+    """
+    if not receiver:
+        logger.warning(f"EMAIL_RECEIVER is not set; no reconciliation email queued for {target_month:%Y-%m}")
+        return False
+    try:
+        subject, html_body = render_reconciliation_email(recon_logs, misc_logs, target_month)
+        with db.begin_nested():
+            db.add(EmailOutbox(
+                month_year=target_month,
+                recipient=receiver,
+                subject=subject,
+                html_body=html_body
+            ))
+    except Exception as e:
+        logger.error(f"Could not queue reconciliation email for {target_month:%Y-%m}: {e}")
+        return False
+    return True
+
+# ----------- Background sender ------------
+class OutboxSender:
+    """
+    Drains email_outbox on a background thread over one long-lived,
+    authenticated SMTP session. Several pending months for the same
+    recipient go out as a single digest. Failures are retried with
+    exponential backoff and end up as FAILED with the error recorded.
+    """
+
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._smtp = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=SMTP_TIMEOUT + 5)
+        self._disconnect()
+
+    def wake(self):
+        """Call after committing new outbox rows."""
+        self._wake.set()
+
+    def _run(self):
+        timeout = 0  # rows left by a previous process go out on start
+        while not self._stop.is_set():
+            woken = self._wake.wait(timeout)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            if woken:
+                # Give back-to-back reconciles a moment so they share one digest
+                time.sleep(OUTBOX_BATCH_WINDOW)
+            try:
+                timeout = self._sleep_for(self.flush())
+            except Exception as e:
+                logger.error(f"Outbox flush failed: {e}")
+                timeout = OUTBOX_POLL_SECONDS
+
+    @staticmethod
+    def _sleep_for(next_due) -> float:
+        """Until the next retry is due; the idle interval when nothing is pending."""
+        if next_due is None:
+            return OUTBOX_IDLE_SECONDS
+        seconds = (next_due - datetime.utcnow()).total_seconds()
+        # Floor: rows due now but locked by another worker's flush shouldn't make us spin
+        return min(max(seconds, OUTBOX_BATCH_WINDOW), OUTBOX_IDLE_SECONDS)
+
+    # ----- SMTP session -----
+    def _connect(self):
+        server = smtplib.SMTP(smtp_server, smtp_port, timeout=SMTP_TIMEOUT)
+        server.starttls()
+        server.login(sender.strip(), password.strip())
+        logger.info(f"SMTP session opened to {smtp_server}:{smtp_port}")
+        return server
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+    def _connection(self):
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._disconnect()
+        self._smtp = self._connect()
+        return self._smtp
+
+    def _send(self, msg):
+        try:
+            self._connection().send_message(msg)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # Stale session: reconnect once before counting it as a failed attempt
+            self._disconnect()
+            self._connection().send_message(msg)
+
+    # ----- Draining -----
+    def flush(self):
+        """Sends everything due; returns when the next pending row is due (None if none are)."""
+        db = self._session_factory()
+        try:
+            now = datetime.utcnow()
+            # SKIP LOCKED: several app workers can drain the same outbox without double-sending
+            due = db.query(EmailOutbox).filter(
+                EmailOutbox.status == "PENDING",
+                EmailOutbox.next_attempt_at <= now
+            ).order_by(EmailOutbox.month_year, EmailOutbox.created_at).with_for_update(skip_locked=True).all()
+
+            by_recipient = defaultdict(list)
+            for item in due:
+                by_recipient[item.recipient].append(item)
+
+            for recipient, items in by_recipient.items():
+                self._deliver(db, recipient, items)
+            db.commit()
+
+            return db.query(func.min(EmailOutbox.next_attempt_at)).filter(EmailOutbox.status == "PENDING").scalar()
+        finally:
+            db.close()
+
+    def _deliver(self, db, recipient, items):
+        msg = MIMEMultipart()
+        msg['From'] = sender
+        msg['To'] = recipient
+        if len(items) == 1:
+            msg['Subject'] = items[0].subject
+            body = items[0].html_body
+        else:
+            months = ", ".join(i.month_year.strftime('%b %Y') for i in items if i.month_year)
+            msg['Subject'] = f"📊 Smart LLC - Reconciliation Digest: {months}"
+            body = "<hr>".join(i.html_body for i in items)
+        msg.attach(MIMEText(body, 'html'))
+
+        try:
+            self._send(msg)
+        except Exception as e:
+            self._disconnect()
+            for item in items:
+                item.attempts = (item.attempts or 0) + 1
+                item.last_error = str(e)
+                if item.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    item.status = "FAILED"
+                    logger.error(f"❌ Giving up on email {item.id} ({item.subject}) after {item.attempts} attempts: {e}")
+                else:
+                    delay = min(OUTBOX_BACKOFF_SECONDS * 2 ** (item.attempts - 1), OUTBOX_BACKOFF_MAX)
+                    item.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+                    logger.warning(f"Email {item.id} failed (attempt {item.attempts}), retrying in {delay}s: {e}")
+            return
+
+        sent_at = datetime.utcnow()
+        for item in items:
+            item.status = "SENT"
+            item.sent_at = sent_at
+        logger.info(f"✅ Sent {len(items)} queued report(s) to {recipient}")
+
+outbox_sender = OutboxSender()
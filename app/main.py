@@ -4,30 +4,44 @@ import json
 import smtplib
 import io
 import os
+import hmac
+import asyncio
 
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from huggingface_hub import attach_huggingface_oauth, parse_huggingface_oauth
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse
 from collections import defaultdict
 import pandas as pd
-from datetime import datetime
-from sqlalchemy import extract, cast, Date, func
+from datetime import date, datetime
+from typing import List
+from sqlalchemy import extract, cast, Date, func, select
 from fastapi import FastAPI, Depends, Form, File, UploadFile
 
 # Absolute imports for your app structure
-from app.extract import pdf_to_text
-from app.llm import extract_with_llm
-from app.reconcile import run_reconciliation
-from app.schemas import ExtractedDoc
-from app.utils import generate_baselane_csv, get_relevant_text, sheet_to_json, parse_any_date
-from app.database import SessionLocal, engine, get_db # Added get_db here
+from app.pipeline import StatementFile, ExtractionError, reconcile_uploads
+from app.jobs import jobs
+from app.anomaly import rebuild_anomalies
+from app.read_models import month_misc, month_recon, month_statements, statement_history
+from app.templating import html_templates, precompile_templates
+from app.rollups import TREND_GROUPS, latest_rollup_month, rebuild_missing_rollups, trend_report
+from app.concurrency import AdmissionFull, reconcile_gate, submission_key
+from app.export import EXPORT_TABLES, stream_export
+from app.parameters import apply_parameter_upload, parameter_store
+from app.partitions import ensure_partitioned
+from app.migrations import migrate_money_columns
+from app.mailer import outbox_sender
+from app.money import to_cents, from_cents, within_tolerance, money_matches
+from app.llm import get_cascade_stats
+from app.utils import generate_baselane_csv, sheet_to_json, parse_any_date
+from app.database import (
+    READ_PRIMARY_PARAM, SessionLocal, engine, get_db, get_async_read_db, get_read_db, mark_recent_write
+)
 from app import models
 from fastapi.responses import StreamingResponse
-from fastapi.templating import Jinja2Templates
 from fastapi.responses import RedirectResponse
 import csv 
 
-html_templates = Jinja2Templates(directory="app/templates")
 
 # smtp libraries
 from email.mime.text import MIMEText
@@ -37,10 +51,35 @@ from email.mime.multipart import MIMEMultipart
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared secret for the Streamlit client, which calls the API server-to-server without an OAuth session
+RECON_API_TOKEN = os.getenv("RECON_API_TOKEN")
+
 app = FastAPI()
 
-# Create tables in Neon on startup
+# Create tables in Neon on startup, then move month-scoped tables onto partitions (Postgres)
 models.Base.metadata.create_all(bind=engine)
+migrate_money_columns(engine, models.Base.metadata)
+ensure_partitioned(engine)
+
+@app.on_event("startup")
+def start_outbox_sender():
+    outbox_sender.start()
+
+@app.on_event("startup")
+def compile_templates():
+    precompile_templates()
+
+@app.on_event("startup")
+def build_missing_rollups():
+    db = SessionLocal()
+    try:
+        rebuild_missing_rollups(db)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+def stop_outbox_sender():
+    outbox_sender.stop()
 
 def get_current_user(request: Request):
     user = parse_huggingface_oauth(request)
@@ -48,111 +87,157 @@ def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Not logged into Hugging Face")
     return user
 
+def get_api_user(request: Request):
+    """HF OAuth, or `Authorization: Bearer <RECON_API_TOKEN>` for the Streamlit client."""
+    if RECON_API_TOKEN:
+        supplied = request.headers.get("Authorization", "").encode()
+        if hmac.compare_digest(supplied, f"Bearer {RECON_API_TOKEN}".encode()):
+            return "streamlit"
+    return get_current_user(request)
+
 @app.get("/health")
 def health(logs: str = None):
     return {"status": "ok", "message": "Container is healthy"}
 
+@app.get("/llm/stats")
+def llm_stats():
+    return get_cascade_stats()
+
+@app.get("/reconcile/stats")
+def reconcile_stats():
+    return reconcile_gate.stats()
+
+@app.exception_handler(AdmissionFull)
+async def admission_full_handler(request: Request, exc: AdmissionFull):
+    return JSONResponse(
+        status_code=429,
+        content={"error": "Too many reconciliations in progress", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+async def _read_statement_uploads(statements, pdf1, pdf2):
+    uploads = [f for f in (statements or []) + [pdf1, pdf2] if f is not None and f.filename]
+    if not uploads:
+        raise HTTPException(status_code=400, detail="Upload at least one statement PDF")
+    return [StatementFile(filename=f.filename, content=await f.read()) for f in uploads]
+
 @app.post("/reconcile")
 async def reconcile_endpoint(
-    pdf1: UploadFile = File(...),
-    pdf2: UploadFile = File(...),
     sheet_json: UploadFile = File(...),
     month_year: str = Form(...),
-    user=Depends(get_current_user),
-    db: Session = Depends(get_db)      
+    statements: List[UploadFile] = File(None),  # Any number of manager statements
+    pdf1: UploadFile = File(None),              # Legacy two-file form fields
+    pdf2: UploadFile = File(None),
+    user=Depends(get_current_user)
 ):
     # logger.info(f"User {user.user_info.preferred_username} starting reconciliation")
     try:
         month_year_obj = parse_any_date(month_year)
     except ValueError as e:
         print(f"Date Error: {e}")
-    
+
     # Read and extract
-    content1 = await pdf1.read()
-    content2 = await pdf2.read()
+    statement_files = await _read_statement_uploads(statements, pdf1, pdf2)
     bank_bytes = await sheet_json.read()
-    bank_df = pd.read_csv(io.BytesIO(bank_bytes))
-
-    text1 = pdf_to_text(content1)
-    text2 = pdf_to_text(content2)
-
-    # GOGO: Only Page 3 (Index 2)
-    relevant_text1 = get_relevant_text(text1, [2]) 
-    
-    # SURE REALTY: Only Page 1 (Index 0)
-    relevant_text2 = get_relevant_text(text2, [0])
-  
-    # Pass this clean, small string to the LLM
-    parsed1 = extract_with_llm(relevant_text1)
-    parsed2 = extract_with_llm(relevant_text2)
-
-    if not parsed1.get("properties"):
-        logger.error("PDF 1 failed to return property data")
-    
-    if not parsed2.get("properties"):
-        logger.error("PDF 2 failed to return property data")
 
+    # Classify each file to its manager, extract them concurrently
+    # (files seen before come straight from the document registry), reconcile.
+    # An identical submission already in flight is joined instead of re-run.
+    month_str = month_year_obj.strftime("%Y-%m")
+    flight = reconcile_gate.submit(
+        submission_key(month_str, statement_files, bank_bytes), month_str,
+        lambda: _reconcile_month(statement_files, sheet_json.filename, bank_bytes, month_year_obj)
+    )
     try:
-        doc1 = ExtractedDoc(**parsed1)
-        doc2 = ExtractedDoc(**parsed2)
-    except Exception as e:
+        # Shielded: a client disconnect must not cancel work other submitters are waiting on
+        await asyncio.shield(flight.task)
+    except ExtractionError as e:
         logger.error(f"Validation Error: {e}")
         return {"error": "LLM output validation failed", "details": str(e)}
+    except Exception as e:
+        logger.error(f"Reconciliation Endpoint Error: {str(e)}")
+        return {"error": "Processing failed", "details": str(e)}
 
-    # Inject the manager name into each property so the data isn't lost
-    for p in doc1.properties:
-        p.property_management = doc1.property_management
-
-    for p in doc2.properties:
-        p.property_management = doc2.property_management
+    response = RedirectResponse(url=f"/report?month_year={month_str}&msg=success", status_code=303)
+    return mark_recent_write(response)
 
-    ## Merge both PDF properties for reconciliation
-    all_props = doc1.properties + doc2.properties
+async def _reconcile_month(statement_files, bank_filename, bank_bytes, month_year_obj, progress=None):
+    # Shared by every submitter of the same flight, so it owns its session rather than a request's
+    db = SessionLocal()
+    try:
+        return await reconcile_uploads(db, statement_files, bank_filename, bank_bytes, month_year_obj, progress=progress)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
 
-    # --- STEP 5: Save to Neon Database ---
+# ------------------ Reconcile with live progress (SSE) ----------------
+async def _run_job(job, flight):
     try:
-        # 1. DELETE existing records for the month (Prevent Duplicates)
-        db.query(models.RentalStatement).filter(
-            extract('year', models.RentalStatement.statement_date) == month_year_obj.year,
-            extract('month', models.RentalStatement.statement_date) == month_year_obj.month
-        ).delete(synchronize_session=False)
-        
-        for doc, filename in [(doc1, pdf1.filename), (doc2, pdf2.filename)]:
-            
-            stmt_date_obj = parse_any_date(doc.statement_date)
-            property_management = doc.property_management.strip().upper()
-
-            for prop in doc.properties:
-                calc_net = float(prop.rent_paid - prop.management_fees) # Ensure float, not numpy
-
-                new_record = models.RentalStatement(
-                    statement_date=stmt_date_obj, 
-                    property_management=property_management,
-                    address=prop.address,
-                    rent_amount=prop.rent_amount,
-                    rent_paid=prop.rent_paid,
-                    management_fees=prop.management_fees,
-                    net_income=calc_net,
-                    source_file=filename
-                )
-                db.add(new_record)
-
-        db.commit()
-
-        # --- STEP 6: RECONCILE ---
-        result = run_reconciliation(
-            db=db,
-            bank_df=bank_df,
-            extracted_props=all_props,
-            target_month=month_year_obj
-        )
+        await flight.task
+        # No response to set the sticky cookie on, so the link itself pins the read to the primary
+        job.emit("done", report_url=f"/report?month_year={job.month}&msg=success&{READ_PRIMARY_PARAM}=1")
+    except ExtractionError as e:
+        job.emit("error", error="LLM output validation failed", details=str(e))
     except Exception as e:
-        db.rollback()
-        logger.error(f"Reconciliation Endpoint Error: {str(e)}")
-        return {"error": "Processing failed", "details": str(e)}
+        logger.error(f"Reconcile job {job.id} failed: {e}")
+        job.emit("error", error="Processing failed", details=str(e))
+
+@app.post("/reconcile/jobs", status_code=202)
+async def start_reconcile_job(
+    sheet_json: UploadFile = File(...),
+    month_year: str = Form(...),
+    statements: List[UploadFile] = File(None),
+    pdf1: UploadFile = File(None),
+    pdf2: UploadFile = File(None),
+    user=Depends(get_api_user)
+):
+    try:
+        month_year_obj = parse_any_date(month_year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    statement_files = await _read_statement_uploads(statements, pdf1, pdf2)
+    bank_bytes = await sheet_json.read()
 
     month_str = month_year_obj.strftime("%Y-%m")
-    return RedirectResponse(url=f"/report?month_year={month_str}&msg=success", status_code=303)
+    key = submission_key(month_str, statement_files, bank_bytes)
+
+    # Identical submission already running as a job: hand back its event stream
+    flight = reconcile_gate.inflight(key)
+    if flight is not None and flight.job is not None:
+        job = flight.job
+        return {"job_id": job.id, "events_url": f"/reconcile/jobs/{job.id}/events", "shared": True}
+
+    job = jobs.create(month_str)
+    if flight is None:
+        try:
+            flight = reconcile_gate.submit(
+                key, month_str,
+                lambda: _reconcile_month(statement_files, sheet_json.filename, bank_bytes, month_year_obj, progress=job.emit)
+            )
+        except AdmissionFull as e:
+            job.emit("error", error="Too many reconciliations in progress", retry_after=e.retry_after)
+            raise
+        flight.job = job
+    else:
+        job.emit("joined", details="Same files already reconciling; waiting for that run")
+
+    # Keep a reference on the job so the task isn't garbage-collected mid-run
+    job.task = asyncio.create_task(_run_job(job, flight))
+    return {"job_id": job.id, "events_url": f"/reconcile/jobs/{job.id}/events", "shared": False}
+
+@app.get("/reconcile/jobs/{job_id}/events")
+async def reconcile_job_events(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return StreamingResponse(
+        job.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ------------------ Report ----------------
 @app.get("/report", response_class=HTMLResponse)
@@ -160,11 +245,8 @@ async def unified_dashboard(
     request: Request,
     month_year: str = None, # Default to current month
     property_management: str = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    # 1. Base Query for the Table
-    query = db.query(models.RentalStatement)
-
     # 1. Initialize variables with defaults to prevent "Undefined" errors
     total_collected = 0.0
     total_expected = 0.0
@@ -176,7 +258,7 @@ async def unified_dashboard(
 
     if not month_year:
         # Look for the most recent month in the Recon Log
-        latest_recon = db.query(func.max(models.PropertyReconLog.month_year)).scalar()
+        latest_recon = (await db.execute(select(func.max(models.PropertyReconLog.month_year)))).scalar()
         if latest_recon:
             month_year = latest_recon.strftime("%Y-%m")
         else:
@@ -185,42 +267,127 @@ async def unified_dashboard(
     
     year_val, month_val = map(int, month_year.split("-"))
 
-    query = query.filter(
-        extract('year', models.RentalStatement.statement_date) == year_val,
-        extract('month', models.RentalStatement.statement_date) == month_val
-    )
     # 2. Summary Logic (Executive Cards)
-    # We fetch all for the month to calculate the cards regardless of the prop management filter
-    summary_items = query.all()
+    # We fetch all for the month (displayed columns only) to calculate the cards regardless of the prop management filter
+    summary_items = await month_statements(db, date(year_val, month_val, 1))
     
-    # Group totals for the cards
-    gogo_group = [i for i in summary_items if i.property_management == "GOGO PROPERTY"]
-    sure_group = [i for i in summary_items if i.property_management == "SURE REALTY"]
-    
-    gogo_total = sum((i.rent_paid - i.management_fees) for i in gogo_group)
-    sure_total = sum((i.rent_paid - i.management_fees) for i in sure_group)
-
-    # Reconciliation Logic (Comparing to Bank)
-    gogo_match = "✅ MATCHED" if gogo_total == 6751.50 else "❌ DISCREPANCY"
-    sure_match = "✅ MATCHED" if sure_total == 1833.00 else "❌ DISCREPANCY"
+    # Bank deposit per manager, as recorded by the month's reconciliation
+    deposit_rows = (await db.execute(
+        select(models.PropertyReconLog.property_management, func.max(models.PropertyReconLog.bank_deposit_total)).where(
+            extract('year', models.PropertyReconLog.month_year) == year_val,
+            extract('month', models.PropertyReconLog.month_year) == month_val
+        ).group_by(models.PropertyReconLog.property_management)
+    )).all()
+    bank_deposits = {(name or "").upper(): total or 0.0 for name, total in deposit_rows}
+
+    # Group totals for the cards (integer cents, compared with the deposit tolerance)
+    manager_cards = []
+    for manager in sorted({i.property_management for i in summary_items if i.property_management}):
+        group = [i for i in summary_items if i.property_management == manager]
+        net_cents = int(to_cents([i.rent_paid for i in group]).sum() - to_cents([i.management_fees for i in group]).sum())
+        bank_total = bank_deposits.get(manager.upper(), 0.0)
+        matched = money_matches(from_cents(net_cents), bank_total, "deposit")
+
+        # Reconciliation Logic (Comparing to Bank)
+        manager_cards.append({
+            "name": manager,
+            "net_total": from_cents(net_cents),
+            "bank_total": bank_total,
+            "match": "✅ MATCHED" if matched else "❌ DISCREPANCY",
+        })
 
-    # 3. Final Table Filtering (if a specific property management is selected)
+    # 3. Final Table Filtering (if a specific property management is selected), from the rows already loaded
+    statements = summary_items
     if property_management:
-        query = query.filter(models.RentalStatement.property_management == property_management.upper())
-    
-    statements = query.order_by(models.RentalStatement.statement_date.desc()).all()
+        statements = [i for i in summary_items if i.property_management == property_management.upper()]
 
     return html_templates.TemplateResponse("dashboard.html", {
         "request": request,
         "statements": statements,
-        "gogo_total": gogo_total,
-        "gogo_match": gogo_match,
-        "sure_total": sure_total,
-        "sure_match": sure_match,
+        "manager_cards": manager_cards,
         "selected_month": month_year,
         "selected_property_management": property_management,
         "username": "smartrenters" 
     })
+# ---------------- Trends / YTD (from monthly rollups) --------------------
+def _trend_report(db: Session, start: str, end: str, group_by: str, ytd: bool):
+    if group_by not in TREND_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(TREND_GROUPS)}")
+    try:
+        end_month = parse_any_date(end) if end else latest_rollup_month(db)
+        start_month = parse_any_date(start) if start else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    end_month = end_month or datetime.utcnow().date()
+    if ytd:
+        start_month = end_month.replace(month=1, day=1)
+    elif start_month is None:
+        # Default: trailing twelve months
+        year, month = divmod(end_month.year * 12 + end_month.month - 1 - 11, 12)
+        start_month = end_month.replace(year=year, month=month + 1, day=1)
+    if start_month > end_month:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return trend_report(db, start_month, end_month, group_by)
+
+@app.get("/report/trends/data")
+async def trends_data(
+    start: str = None,          # "YYYY-MM"
+    end: str = None,            # "YYYY-MM", defaults to the latest reconciled month
+    group_by: str = "property", # property | manager
+    ytd: bool = False,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    return await db.run_sync(lambda s: _trend_report(s, start, end, group_by, ytd))
+
+@app.get("/report/trends", response_class=HTMLResponse)
+async def trends_page(
+    request: Request,
+    start: str = None,
+    end: str = None,
+    group_by: str = "property",
+    ytd: bool = False,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    report = await db.run_sync(lambda s: _trend_report(s, start, end, group_by, ytd))
+    return html_templates.TemplateResponse("trends.html", {
+        "request": request,
+        "report": report,
+        "ytd": ytd
+    })
+
+# ---------------- Variance anomalies --------------------
+@app.get("/anomalies")
+async def list_anomalies(
+    month_year: str = None,     # "YYYY-MM", defaults to the latest month with anomalies
+    address: str = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    Anomaly = models.ReconAnomaly
+    if month_year:
+        try:
+            month = parse_any_date(month_year)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        month = (await db.execute(select(func.max(Anomaly.month_year)))).scalar()
+        if month is None:
+            return {"month_year": None, "anomalies": []}
+
+    query = select(
+        Anomaly.address, Anomaly.property_management, Anomaly.metric, Anomaly.value,
+        Anomaly.baseline, Anomaly.zscore, Anomaly.kind
+    ).where(Anomaly.month_year == month.replace(day=1))
+    if address:
+        query = query.where(Anomaly.address.ilike(f"%{address}%"))
+    rows = (await db.execute(query.order_by(Anomaly.address, Anomaly.metric))).mappings().all()
+    return {"month_year": month.strftime("%Y-%m"), "anomalies": [dict(r) for r in rows]}
+
+@app.post("/anomalies/rebuild")
+async def rebuild_anomaly_history(user=Depends(get_current_user), db: Session = Depends(get_db)):
+    # Whole-history replay (e.g. after a backfill or a hoa_frequency correction)
+    return await asyncio.to_thread(rebuild_anomalies, db)
+
 # ---------------- Audit Log --------------------
 @app.get("/history")
 async def audit_log(
@@ -228,27 +395,15 @@ async def audit_log(
     month_year: str = None, 
     property_management: str = None, 
     property_name: str = None, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    query = db.query(models.RentalStatement)
-
-    # Filter by Month/Year
+    # Filter by Month/Year, property_management and Property (partial match search)
+    month = None
     if month_year:
         year_val, month_val = map(int, month_year.split("-"))
-        query = query.filter(
-            extract('year', models.RentalStatement.statement_date) == year_val,
-            extract('month', models.RentalStatement.statement_date) == month_val
-        )
-
-    # Filter by property_management
-    if property_management:
-        query = query.filter(models.RentalStatement.property_management == property_management)
-
-    # Filter by Property (Partial match search)
-    if property_name:
-        query = query.filter(models.RentalStatement.address.ilike(f"%{property_name}%"))
+        month = date(year_val, month_val, 1)
 
-    statements = query.order_by(models.RentalStatement.statement_date.desc()).all()
+    statements = await statement_history(db, month, property_management, property_name)
 
     return html_templates.TemplateResponse("history.html", {
         "request": request,
@@ -263,7 +418,7 @@ async def audit_log(
 def export_baselane(
     property_management: str = None, 
     month_year: str = None, # Expected format "YYYY-MM"
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     query = db.query(models.RentalStatement)
 
@@ -338,37 +493,43 @@ def export_baselane(
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
+## ------- Columnar export (Parquet / Arrow IPC) ---------------
+@app.get("/export/columnar")
+def export_columnar(
+    table: str = "statements",   # statements | recon | misc
+    start: str = None,           # "YYYY-MM"
+    end: str = None,             # "YYYY-MM", defaults to start
+    format: str = "parquet"      # parquet | arrow
+):
+    if table not in EXPORT_TABLES or format not in ("parquet", "arrow") or not start:
+        raise HTTPException(status_code=400, detail="Use table=statements|recon|misc, start=YYYY-MM, format=parquet|arrow")
+    try:
+        start_month = parse_any_date(start)
+        end_month = parse_any_date(end) if end else start_month
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    extension, media_type = ("parquet", "application/vnd.apache.parquet") if format == "parquet" \
+        else ("arrows", "application/vnd.apache.arrow.stream")
+    filename = f"{table}_{start_month:%Y-%m}_{end_month:%Y-%m}.{extension}"
+    return StreamingResponse(
+        stream_export(table, start_month, end_month, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 ## ------- Load PropertyMaster table -----------------------------
 @app.post("/parameters/upload")
 async def upload_parameters(file: UploadFile = File(...), db: Session = Depends(get_db)):
     try:
         # Read the uploaded file
         df = pd.read_csv(file.file) # or pd.read_csv if using CSV
-        
-        # 1. Close out current active parameters (Set effective_to to today)
-        db.query(models.PropertyParameter).filter(
-            models.PropertyParameter.effective_to == None
-        ).update({"effective_to": datetime.utcnow().date()})
-
-        # 2. Loop through spreadsheet rows and insert new ones
-        for _, row in df.iterrows():
-            new_param = models.PropertyParameter(
-                property_management=str(row['Property_Management']),
-                address=row['Property'],
-                expected_rent=row['Rental_Income'],
-                management_fee=row['Management_Fee'],
-                mortgage_payment=row['Mortgage_Payment'],
-                hoa_fee=row['HOA'],
-                hoa_frequency=row['HOA_Frequency'],
-                hoa_account_no=str(row['HOA_Account_No']),
-                hoa_phone_no=str(row['HOA_Phone_No']),
-                notes=str(row['Notes']),
-                effective_from=datetime.utcnow().date()
-            )
-            db.add(new_param)
-        
-        db.commit()
-        return RedirectResponse(url="/parameters?msg=updated", status_code=303)
+
+        # Only version the properties that actually changed
+        counts = apply_parameter_upload(db, df)
+
+        query = "&".join(f"{k}={v}" for k, v in counts.items())
+        return mark_recent_write(RedirectResponse(url=f"/parameters?msg=updated&{query}", status_code=303))
     except Exception as e:
         # This will print the error in your VS Code / Terminal console
         print(f"ERROR BULK LOADING: {e}")
@@ -376,12 +537,10 @@ async def upload_parameters(file: UploadFile = File(...), db: Session = Depends(
  
 ## ------- Report to view Property Parameters --------------------
 @app.get("/parameters")
-async def view_parameters(request: Request, db: Session = Depends(get_db)):
+async def view_parameters(request: Request, db: AsyncSession = Depends(get_async_read_db)):
     try:
-        # 1. Fetch parameters (ensure the table exists!)
-        parameters = db.query(models.PropertyParameter).filter(
-            models.PropertyParameter.effective_to == None
-        ).all()
+        # 1. Fetch parameters (the store itself always loads from the primary; this session only reads the cache)
+        parameters = await db.run_sync(parameter_store.current)
         
         # 2. Safety check for count
         property_count = len(parameters) if parameters else 0
@@ -399,24 +558,24 @@ async def view_parameters(request: Request, db: Session = Depends(get_db)):
     
 ## ------- Report by property_management and Month/Year. ---------------
 @app.get("/report/details")
-def view_detailed_report(
+async def view_detailed_report(
     property_management: str = None, 
     month_year: str = None, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    query = db.query(models.RentalStatement)
+    query = select(models.RentalStatement)
 
     if property_management:
-        query = query.filter(models.RentalStatement.property_management == property_management.upper())
+        query = query.where(models.RentalStatement.property_management == property_management.upper())
 
     if month_year:
         year, month = map(int, month_year.split("-"))
-        query = query.filter(
+        query = query.where(
             extract('year', models.RentalStatement.statement_date) == year,
             extract('month', models.RentalStatement.statement_date) == month
         )
 
-    statements = query.order_by(models.RentalStatement.statement_date.desc()).all()
+    statements = (await db.execute(query.order_by(models.RentalStatement.statement_date.desc()))).scalars().all()
     
     # This returns the data to your frontend
     return {
@@ -430,7 +589,7 @@ attach_huggingface_oauth(app)
 async def upload_page(
     request: Request, 
     month_year: str = None, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     user = parse_huggingface_oauth(request)
     if not user:
@@ -438,7 +597,7 @@ async def upload_page(
 
     # 1. Smart Date Logic: Default to the most recent data available
     if not month_year:
-        latest = db.query(func.max(models.PropertyReconLog.month_year)).scalar()
+        latest = (await db.execute(select(func.max(models.PropertyReconLog.month_year)))).scalar()
         month_year = latest.strftime("%Y-%m") if latest else datetime.utcnow().strftime("%Y-%m")
 
     try:
@@ -447,35 +606,29 @@ async def upload_page(
         now = datetime.utcnow()
         year_val, month_val = now.year, now.month
 
-    # 2. Query the Recon Logs for the Summary Gauges
-    recon_logs = db.query(models.PropertyReconLog).filter(
-        extract('year', models.PropertyReconLog.month_year) == year_val,
-        extract('month', models.PropertyReconLog.month_year) == month_val
-    ).all()
+    # 2. Query the Recon Logs for the Summary Gauges (displayed columns only)
+    recon_logs = await month_recon(db, date(year_val, month_val, 1))
 
     # 3. Fetch Miscellaneous Expenses for the same period
-    misc_logs = db.query(models.MiscExpenseLog).filter(
-        extract('year', models.MiscExpenseLog.month_year) == year_val,
-        extract('month', models.MiscExpenseLog.month_year) == month_val
-    ).all()
+    misc_logs = await month_misc(db, date(year_val, month_val, 1))
 
-    # 4. Aggregate Data with Consistent Wording
+    # 4. Aggregate Data with Consistent Wording (summed in cents)
     # --- Rent ---
-    actual_rent = sum(log.actual_rent for log in recon_logs) if recon_logs else 0.0
-    target_rent = sum(log.target_rent for log in recon_logs) if recon_logs else 0.0
+    actual_rent = from_cents(to_cents([log.actual_rent for log in recon_logs]).sum()) if recon_logs else 0.0
+    target_rent = from_cents(to_cents([log.target_rent for log in recon_logs]).sum()) if recon_logs else 0.0
     rent_percent = (actual_rent / target_rent * 100) if target_rent > 0 else 0
 
     # --- HOA ---
-    actual_hoa = sum(log.actual_hoa for log in recon_logs) if recon_logs else 0.0
-    target_hoa = sum(log.target_hoa for log in recon_logs) if recon_logs else 0.0
-    hoa_verified = sum(1 for log in recon_logs if log.hoa_variance == 0) if recon_logs else 0
+    actual_hoa = from_cents(to_cents([log.actual_hoa for log in recon_logs]).sum()) if recon_logs else 0.0
+    target_hoa = from_cents(to_cents([log.target_hoa for log in recon_logs]).sum()) if recon_logs else 0.0
+    hoa_verified = int(within_tolerance(to_cents([log.hoa_variance for log in recon_logs]), 0, "hoa").sum()) if recon_logs else 0
     total_props = len(recon_logs)
     hoa_percent = (hoa_verified / total_props * 100) if total_props > 0 else 0
 
     # --- Mortgage ---
-    actual_mort = sum(log.actual_mortgage for log in recon_logs) if recon_logs else 0.0
-    target_mort = sum(log.target_mortgage for log in recon_logs) if recon_logs else 0.0
-    mort_verified = sum(1 for log in recon_logs if log.mortgage_variance == 0) if recon_logs else 0
+    actual_mort = from_cents(to_cents([log.actual_mortgage for log in recon_logs]).sum()) if recon_logs else 0.0
+    target_mort = from_cents(to_cents([log.target_mortgage for log in recon_logs]).sum()) if recon_logs else 0.0
+    mort_verified = int(within_tolerance(to_cents([log.mortgage_variance for log in recon_logs]), 0, "mortgage").sum()) if recon_logs else 0
     mortgage_percent = (mort_verified / total_props * 100) if total_props > 0 else 0
 
     # 4. Return Data to index.html
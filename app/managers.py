@@ -0,0 +1,93 @@
+import os
+import json
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Optional JSON file with extra/overriding manager profiles, so a new
+# property manager can be onboarded without a code change:
+# [{"name": "ACME RENTALS", "keywords": ["ACME"], "page_indices": [0, 1],
+#   "prompt_rules": ["..."], "bank_aliases": ["Acme Rentals LLC"]}]
+MANAGER_REGISTRY_FILE = os.getenv("MANAGER_REGISTRY_FILE")
+
+@dataclass(frozen=True)
+class ManagerProfile:
+    name: str                                  # Canonical name stored in the DB, e.g. 'GOGO PROPERTY'
+    keywords: Tuple[str, ...]                  # Markers in the PDF text/filename used to classify a file
+    page_indices: Tuple[int, ...] = ()         # 0-based pages sent to the parser (empty = whole document)
+    parser: str = "llm"                        # Key into PARSERS
+    prompt_rules: Tuple[str, ...] = ()         # Manager-specific naming rules for the LLM prompt
+    bank_aliases: Tuple[str, ...] = ()         # Merchant names of this manager's deposits on the bank export
+
+    def all_bank_aliases(self):
+        return self.bank_aliases or (self.name,)
+
+DEFAULT_MANAGERS = [
+    ManagerProfile(
+        name="GOGO PROPERTY",
+        keywords=("GOGO",),
+        page_indices=(2,),  # GOGO: Only Page 3 (Index 2)
+        prompt_rules=("'property_management': set this to 'GOGO PROPERTY'.",),
+        bank_aliases=("GOGO PROPERTY",),
+    ),
+    ManagerProfile(
+        name="SURE REALTY",
+        keywords=("SURE REALTY", "MANAGEMENT DETAIL REPORT"),
+        page_indices=(0,),  # SURE REALTY: Only Page 1 (Index 0)
+        prompt_rules=(
+            "'property_management': set this to 'SURE REALTY'.",
+            "'address': set this to '2560 Coventry St.' for 'Management Detail Report' document",
+        ),
+        bank_aliases=("Sure Realty",),
+    ),
+]
+
+def _profile_from_dict(data):
+    return ManagerProfile(
+        name=data["name"].strip().upper(),
+        keywords=tuple(data.get("keywords") or [data["name"]]),
+        page_indices=tuple(data.get("page_indices") or ()),
+        parser=data.get("parser", "llm"),
+        prompt_rules=tuple(data.get("prompt_rules") or ()),
+        bank_aliases=tuple(data.get("bank_aliases") or ()),
+    )
+
+def load_registry(path: Optional[str] = None) -> List[ManagerProfile]:
+    """Built-in profiles, overridden/extended by MANAGER_REGISTRY_FILE when present."""
+    registry = {m.name: m for m in DEFAULT_MANAGERS}
+    path = path or MANAGER_REGISTRY_FILE
+    if path:
+        try:
+            with open(path) as f:
+                for entry in json.load(f):
+                    profile = _profile_from_dict(entry)
+                    registry[profile.name] = profile
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load manager registry {path}: {e}")
+    return list(registry.values())
+
+MANAGERS = load_registry()
+
+def get_manager(name: str) -> Optional[ManagerProfile]:
+    name = (name or "").strip().upper()
+    return next((m for m in MANAGERS if m.name == name), None)
+
+def all_bank_aliases():
+    """Every manager deposit alias, used to keep manager deposits out of misc expenses."""
+    return [alias for m in MANAGERS for alias in m.all_bank_aliases()]
+
+# ----------- Classify a statement to its manager ------------
+def classify_document(text: str, filename: str = "") -> Optional[ManagerProfile]:
+    """
+    Picks the manager whose keywords appear most often in the statement text
+    (filename hits count too). Returns None when nothing matches.
+    """
+    haystack = f"{filename}\n{text}".upper()
+    best, best_score = None, 0
+    for manager in MANAGERS:
+        score = sum(haystack.count(k.upper()) for k in manager.keywords)
+        if score > best_score:
+            best, best_score = manager, score
+    return best
@@ -0,0 +1,35 @@
+import logging
+
+from sqlalchemy import text
+
+from app.database import without_statement_timeout
+from app.money import Money
+
+logger = logging.getLogger(__name__)
+
+# Small idempotent schema migrations that create_all can't do (it never alters existing tables).
+# Run at startup after create_all; every step checks the catalog first.
+
+def _money_columns(metadata):
+    for table in metadata.sorted_tables:
+        for column in table.columns:
+            if column.type is Money:
+                yield table.name, column.name
+
+def migrate_money_columns(engine, metadata):
+    """double precision -> NUMERIC(12,2), rounding existing values to the cent (Postgres only)."""
+    if engine.dialect.name != "postgresql":
+        return  # SQLite stores NUMERIC affinity as-is; nothing to convert
+
+    with engine.begin() as conn:
+        without_statement_timeout(conn)  # ALTER TYPE rewrites the whole table
+        for table, column in _money_columns(metadata):
+            data_type = conn.execute(text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = :t AND column_name = :c"
+            ), {"t": table, "c": column}).scalar()
+            if data_type == "double precision":
+                logger.info(f"Migrating {table}.{column} to NUMERIC(12,2)")
+                conn.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN {column} TYPE NUMERIC(12,2) USING round({column}::numeric, 2)"
+                ))
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, Date, String, Float, DateTime, JSON
+from sqlalchemy import Column, Integer, Date, String, DateTime, JSON, Text, Float, UniqueConstraint
 from app.database import Base
+from app.money import Money
 from datetime import datetime
 from pydantic import BaseModel, Field
 from typing import List
@@ -24,10 +25,10 @@ class RentalStatement(Base):
     statement_date = Column(Date, nullable=False)
     property_management = Column(String)  # GOGO or SURE
     address = Column(String)
-    rent_amount = Column(Float)
-    rent_paid = Column(Float)
-    management_fees = Column(Float)
-    net_income = Column(Float)
+    rent_amount = Column(Money)
+    rent_paid = Column(Money)
+    management_fees = Column(Money)
+    net_income = Column(Money)
     source_file = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
@@ -37,10 +38,10 @@ class PropertyParameter(Base):
     id = Column(Integer, primary_key=True, index=True)
     property_management = Column(String, nullable=True) # Values: 'GOGO', 'SURE', 'Self-Managed'
     address = Column(String, nullable=False)  # Maps to 'Property'
-    expected_rent = Column(Float)             # Maps to 'Rental_Income'
-    management_fee = Column(Float)             # Maps to 'Management_Fee'
-    mortgage_payment = Column(Float)          # Maps to 'Mortgage_Payment'
-    hoa_fee = Column(Float)                   # Maps to 'HOA'
+    expected_rent = Column(Money)             # Maps to 'Rental_Income'
+    management_fee = Column(Money)             # Maps to 'Management_Fee'
+    mortgage_payment = Column(Money)          # Maps to 'Mortgage_Payment'
+    hoa_fee = Column(Money)                   # Maps to 'HOA'
     hoa_frequency = Column(String)            # Maps to 'HOA_Frequency' (M/Q)
     hoa_account_no = Column(String)           # Maps to 'HOA_Account_No'
     hoa_phone_no = Column(String)             # Maps to 'HOA_Phone_No'
@@ -59,21 +60,21 @@ class PropertyReconLog(Base):
     property_management = Column(String, nullable=False)
     
     # Rent Fields
-    target_rent = Column(Float, default=0.0)
-    actual_rent = Column(Float, default=0.0)
-    rent_variance = Column(Float, default=0.0)
+    target_rent = Column(Money, default=0.0)
+    actual_rent = Column(Money, default=0.0)
+    rent_variance = Column(Money, default=0.0)
     
     # HOA Fields
-    target_hoa = Column(Float, default=0.0)
-    actual_hoa = Column(Float, default=0.0)
-    hoa_variance = Column(Float, default=0.0)
+    target_hoa = Column(Money, default=0.0)
+    actual_hoa = Column(Money, default=0.0)
+    hoa_variance = Column(Money, default=0.0)
 
     # Mortgage Fields
-    target_mortgage = Column(Float, default=0.0)
-    actual_mortgage = Column(Float, default=0.0)
-    mortgage_variance = Column(Float, default=0.0)
+    target_mortgage = Column(Money, default=0.0)
+    actual_mortgage = Column(Money, default=0.0)
+    mortgage_variance = Column(Money, default=0.0)
         
-    bank_deposit_total = Column(Float, default=0.0)
+    bank_deposit_total = Column(Money, default=0.0)
     # Metadata
     status = Column(String)  # "MATCHED", "DISCREPANCY", "MISSING"
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -85,6 +86,81 @@ class MiscExpenseLog(Base):
     month_year = Column(Date, nullable=False)
     date_cleared = Column(Date) # From Baselane CSV
     description = Column(String) # Raw bank text
-    amount = Column(Float)
+    amount = Column(Money)
     category_suggestion = Column(String) # e.g., "Repairs", "Bank Fee"
-    property_id = Column(Integer, nullable=True) # Linked if possible
\ No newline at end of file
+    property_id = Column(Integer, nullable=True) # Linked if possible
+
+class MonthlyRollup(Base):
+    """One row per property per reconciled month; rebuilt whenever that month is published."""
+    __tablename__ = "monthly_rollups"
+    __table_args__ = (UniqueConstraint("month_year", "address", name="uq_monthly_rollups_month_address"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    month_year = Column(Date, nullable=False, index=True)
+    address = Column(String, nullable=False)
+    property_management = Column(String)
+
+    target_rent = Column(Money, default=0.0)
+    actual_rent = Column(Money, default=0.0)
+    management_fees = Column(Money, default=0.0)  # From the month's statements
+    net_income = Column(Money, default=0.0)       # rent_paid - management_fees, from the statements
+    hoa_variance = Column(Money, default=0.0)
+    mortgage_variance = Column(Money, default=0.0)
+    status = Column(String)
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+
+class AnomalyBaseline(Base):
+    """Exponentially weighted per-property baseline of one metric, per payment phase (see app/anomaly.py)."""
+    __tablename__ = "anomaly_baselines"
+    __table_args__ = (UniqueConstraint("address", "metric", "phase", name="uq_anomaly_baselines_address_metric_phase"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    address = Column(String, nullable=False)
+    metric = Column(String, nullable=False)     # "rent", "hoa", "mortgage"
+    phase = Column(Integer, default=0)          # month index % HOA period (0 for monthly metrics)
+    count = Column(Integer, default=0)
+    mean_cents = Column(Float, default=0.0)     # Statistics, not money: kept as float cents
+    var_cents = Column(Float, default=0.0)
+    last_month = Column(Date)                   # Last month folded in (re-runs don't count twice)
+
+class ReconAnomaly(Base):
+    __tablename__ = "recon_anomalies"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month_year = Column(Date, nullable=False, index=True)
+    address = Column(String, nullable=False)
+    property_management = Column(String)
+    metric = Column(String, nullable=False)     # "rent", "hoa", "mortgage"
+    value = Column(Money)                       # Actual amount that month
+    baseline = Column(Money)                    # Expected amount from the property's history
+    zscore = Column(Float)
+    kind = Column(String)                       # "OUTLIER" or "LATE_RENT" (offset by the next month)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class UploadedDocument(Base):
+    __tablename__ = "documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)  # Hash of the uploaded bytes
+    kind = Column(String, nullable=False)       # "statement" or "bank"
+    filename = Column(String)                   # First filename this content was seen under
+    property_management = Column(String)        # Manager the statement was classified to
+    page_text = Column(Text)                    # Parsed PDF text (statements)
+    extracted = Column(JSON)                    # ExtractedDoc as JSON (statements)
+    bank_rows = Column(JSON)                    # Parsed bank export rows (bank)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    month_year = Column(Date)                   # Reconciled month the message reports on
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    html_body = Column(Text, nullable=False)    # email.html rendered once at enqueue time
+    status = Column(String, default="PENDING", index=True)  # "PENDING", "SENT", "FAILED"
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime)
\ No newline at end of file
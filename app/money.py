@@ -0,0 +1,33 @@
+import os
+import numpy as np
+from sqlalchemy import Numeric
+
+# Money columns: exact NUMERIC(12,2) in the database, plain floats in Python
+# (templates format them directly); all arithmetic happens in int64 cents.
+Money = Numeric(12, 2, asdecimal=False)
+
+# Allowed |actual - target| per comparison, in cents (0 = exact match)
+TOLERANCE_CENTS = {
+    "rent": int(os.getenv("MONEY_TOLERANCE_RENT_CENTS", "0")),
+    "hoa": int(os.getenv("MONEY_TOLERANCE_HOA_CENTS", "0")),
+    "mortgage": int(os.getenv("MONEY_TOLERANCE_MORTGAGE_CENTS", "0")),
+    "deposit": int(os.getenv("MONEY_TOLERANCE_DEPOSIT_CENTS", "0")),
+}
+
+def to_cents(values) -> np.ndarray:
+    """Dollars (float/Decimal/None, scalar or sequence) -> int64 cents, missing as 0."""
+    arr = np.asarray(values, dtype=float)
+    return np.rint(np.nan_to_num(arr, nan=0.0) * 100).astype(np.int64)
+
+def from_cents(cents):
+    """int64 cents -> float dollars (array in, array out; scalar in, float out)."""
+    arr = np.asarray(cents, dtype=np.int64) / 100.0
+    return float(arr) if arr.ndim == 0 else arr
+
+def within_tolerance(actual_cents, target_cents, kind: str):
+    """Vectorized |actual - target| <= tolerance for the comparison kind."""
+    return np.abs(np.asarray(actual_cents) - np.asarray(target_cents)) <= TOLERANCE_CENTS[kind]
+
+def money_matches(actual, target, kind: str) -> bool:
+    """Scalar dollars comparison with the same tolerance rules."""
+    return bool(within_tolerance(to_cents(actual), to_cents(target), kind))
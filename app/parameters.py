@@ -0,0 +1,229 @@
+import logging
+import calendar
+import threading
+from bisect import bisect_right
+from dataclasses import dataclass, fields as dataclass_fields
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, engine
+from app.models import PropertyParameter
+
+logger = logging.getLogger(__name__)
+
+# Spreadsheet column -> PropertyParameter column
+SHEET_COLUMNS = {
+    "Property_Management": "property_management",
+    "Property": "address",
+    "Rental_Income": "expected_rent",
+    "Management_Fee": "management_fee",
+    "Mortgage_Payment": "mortgage_payment",
+    "HOA": "hoa_fee",
+    "HOA_Frequency": "hoa_frequency",
+    "HOA_Account_No": "hoa_account_no",
+    "HOA_Phone_No": "hoa_phone_no",
+    "Notes": "notes",
+}
+KEY_COLUMNS = ["_pm_key", "_addr_key"]
+MONEY_COLUMNS = ["expected_rent", "management_fee", "mortgage_payment", "hoa_fee"]
+TEXT_COLUMNS = ["hoa_frequency", "hoa_account_no", "hoa_phone_no", "notes"]
+# These have always been stored via str(), so blanks come through as 'nan'
+STR_COLUMNS = ["property_management", "hoa_account_no", "hoa_phone_no", "notes"]
+
+# HOA_Frequency -> months between HOA payments (blank/unknown = monthly)
+HOA_PERIOD_MONTHS = {
+    "M": 1, "MONTHLY": 1,
+    "Q": 3, "QUARTERLY": 3,
+    "S": 6, "SA": 6, "SEMI-ANNUAL": 6, "SEMIANNUAL": 6,
+    "A": 12, "Y": 12, "ANNUAL": 12, "ANNUALLY": 12, "YEARLY": 12,
+}
+
+def hoa_period_months(frequency) -> int:
+    key = str(frequency or "").strip().upper()
+    if key.isdigit() and 1 <= int(key) <= 12:
+        return int(key)
+    return HOA_PERIOD_MONTHS.get(key, 1)
+
+def _add_keys(df: pd.DataFrame) -> pd.DataFrame:
+    df["_pm_key"] = df["property_management"].fillna("").astype(str).str.strip().str.upper()
+    df["_addr_key"] = df["address"].fillna("").astype(str).str.strip().str.upper()
+    return df
+
+def sheet_to_parameters(sheet_df: pd.DataFrame) -> pd.DataFrame:
+    """Renames the spreadsheet columns and applies the same typing the row-by-row loader used."""
+    df = sheet_df[list(SHEET_COLUMNS)].rename(columns=SHEET_COLUMNS)
+    for col in STR_COLUMNS:
+        df[col] = df[col].astype(str)
+    for col in MONEY_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df = _add_keys(df)
+    # Last row wins if the sheet lists a property twice
+    return df.drop_duplicates(subset=KEY_COLUMNS, keep="last")
+
+def active_parameters_frame(db: Session) -> pd.DataFrame:
+    columns = ["id"] + list(SHEET_COLUMNS.values())
+    rows = db.query(*[getattr(PropertyParameter, c) for c in columns]).filter(
+        PropertyParameter.effective_to == None
+    ).all()
+    return _add_keys(pd.DataFrame(rows, columns=columns))
+
+def diff_parameters(uploaded: pd.DataFrame, active: pd.DataFrame):
+    """
+    Vectorized diff on (property_management, address).
+    Returns (new_rows, changed_rows, removed_ids, unchanged_count).
+    """
+    merged = uploaded.merge(active, on=KEY_COLUMNS, how="outer", suffixes=("", "_cur"), indicator=True)
+
+    both = merged[merged["_merge"] == "both"]
+    changed_mask = pd.Series(False, index=both.index)
+    for col in MONEY_COLUMNS:
+        new = pd.to_numeric(both[col], errors="coerce").round(2)
+        cur = pd.to_numeric(both[f"{col}_cur"], errors="coerce").round(2)
+        changed_mask |= ~((new == cur) | (new.isna() & cur.isna()))
+    for col in TEXT_COLUMNS:
+        changed_mask |= both[col].fillna("").astype(str) != both[f"{col}_cur"].fillna("").astype(str)
+
+    new_rows = merged[merged["_merge"] == "left_only"]
+    changed_rows = both[changed_mask]
+    removed_ids = merged.loc[merged["_merge"] == "right_only", "id"].astype(int).tolist()
+    return new_rows, changed_rows, removed_ids, int((~changed_mask).sum())
+
+def _insert_records(rows: pd.DataFrame, effective_from):
+    values = rows[list(SHEET_COLUMNS.values())]
+    records = values.astype(object).where(values.notna(), None).to_dict(orient="records")
+    for record in records:
+        record["effective_from"] = effective_from
+    return records
+
+def apply_parameter_upload(db: Session, sheet_df: pd.DataFrame):
+    """
+    Versions only what changed: new properties are inserted, changed ones get
+    their active row closed and a new version inserted, removed ones are closed.
+    Everything happens in one transaction. Returns the counts.
+    """
+    today = datetime.utcnow().date()
+    uploaded = sheet_to_parameters(sheet_df)
+    active = active_parameters_frame(db)
+
+    new_rows, changed_rows, removed_ids, unchanged = diff_parameters(uploaded, active)
+
+    close_ids = changed_rows["id"].astype(int).tolist() + removed_ids
+    if close_ids:
+        db.execute(
+            update(PropertyParameter).where(PropertyParameter.id.in_(close_ids)).values(effective_to=today)
+        )
+
+    records = _insert_records(pd.concat([new_rows, changed_rows]), today)
+    if records:
+        db.execute(insert(PropertyParameter), records)
+
+    db.commit()
+    parameter_store.invalidate()
+    counts = {"added": len(new_rows), "changed": len(changed_rows), "unchanged": unchanged, "removed": len(removed_ids)}
+    logger.info(f"Parameter upload: {counts}")
+    return counts
+
+
+# ----------- Point-in-time parameter store ------------
+@dataclass(frozen=True)
+class ParameterVersion:
+    id: int
+    property_management: Optional[str]
+    address: str
+    expected_rent: Optional[float]
+    management_fee: Optional[float]
+    mortgage_payment: Optional[float]
+    hoa_fee: Optional[float]
+    hoa_frequency: Optional[str]
+    hoa_account_no: Optional[str]
+    hoa_phone_no: Optional[str]
+    notes: Optional[str]
+    effective_from: Optional[date]
+    effective_to: Optional[date]
+
+    @property
+    def hoa_period(self) -> int:
+        return hoa_period_months(self.hoa_frequency)
+
+    def active_on(self, when: date) -> bool:
+        return self.effective_to is None or when < self.effective_to
+
+class ParameterStore:
+    """
+    Every PropertyParameter version, loaded once and indexed per property by
+    effective_from. as_of() is a bisect per property, so historical re-runs
+    and backfills get that month's targets without querying the table.
+    Invalidated by the parameter upload. Always loaded from the primary:
+    a snapshot from a lagging replica would stay cached and feed
+    run_reconciliation stale targets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[Tuple[str, str], Tuple[List[date], List[ParameterVersion]]]] = None
+        self._first_date: Optional[date] = None
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+    def _load(self, db: Session):
+        # Plain column rows straight into the dataclass; no ORM instances to build or track
+        columns = [getattr(PropertyParameter, f.name) for f in dataclass_fields(ParameterVersion)]
+        rows = db.execute(
+            select(*columns).order_by(PropertyParameter.effective_from, PropertyParameter.id)
+        ).mappings().all()
+        index = {}
+        for row in rows:
+            version = ParameterVersion(**dict(row, effective_from=row["effective_from"] or date.min))
+            key = ((version.property_management or "").strip().upper(), version.address.strip().upper())
+            starts, versions = index.setdefault(key, ([], []))
+            starts.append(version.effective_from)
+            versions.append(version)
+
+        self._first_date = min((starts[0] for starts, _ in index.values()), default=None)
+        logger.info(f"Parameter store loaded {len(rows)} versions for {len(index)} properties")
+        return index
+
+    def _get_index(self, db: Session):
+        with self._lock:
+            if self._index is None:
+                if db.get_bind() is engine:
+                    self._index = self._load(db)
+                else:
+                    # Read-replica (or async) session: load through a primary session instead
+                    primary = SessionLocal()
+                    try:
+                        self._index = self._load(primary)
+                    finally:
+                        primary.close()
+            return self._index, self._first_date
+
+    def as_of(self, db: Session, when: date) -> List[ParameterVersion]:
+        """Parameters in effect on `when` (effective_from <= when < effective_to)."""
+        index, first_date = self._get_index(db)
+        result = []
+        for starts, versions in index.values():
+            pos = bisect_right(starts, when) - 1
+            if pos < 0:
+                # Months before the first ever upload use the original portfolio
+                if first_date is not None and when < first_date and starts[0] == first_date:
+                    result.append(versions[0])
+                continue
+            if versions[pos].active_on(when):
+                result.append(versions[pos])
+        return result
+
+    def for_month(self, db: Session, target_month: date) -> List[ParameterVersion]:
+        """Parameters as of the last day of the month being reconciled."""
+        last_day = calendar.monthrange(target_month.year, target_month.month)[1]
+        return self.as_of(db, target_month.replace(day=last_day))
+
+    def current(self, db: Session) -> List[ParameterVersion]:
+        return self.as_of(db, datetime.utcnow().date())
+
+parameter_store = ParameterStore()
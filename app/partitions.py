@@ -0,0 +1,143 @@
+import logging
+from datetime import date
+from typing import List
+
+from sqlalchemy import MetaData, insert, text
+from sqlalchemy.orm import Session
+
+from app.database import without_statement_timeout
+
+logger = logging.getLogger(__name__)
+
+# Month-scoped tables and their partition key
+PARTITIONED_TABLES = {
+    "rental_statements": "statement_date",
+    "property_recon_log": "month_year",
+    "misc_expense_logs": "month_year",
+}
+
+# table -> bool, so the catalog is only asked once per process
+_partitioned_cache = {}
+
+def month_bounds(month: date):
+    start = month.replace(day=1)
+    end = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    return start, end
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month.year:04d}_{month.month:02d}"
+
+def _is_postgres(bind) -> bool:
+    return bind.dialect.name == "postgresql"
+
+def _relkind(conn, table: str):
+    return conn.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = :t AND n.nspname = current_schema()"
+    ), {"t": table}).scalar()
+
+def _is_partitioned(conn, table: str) -> bool:
+    if table not in _partitioned_cache:
+        _partitioned_cache[table] = _is_postgres(conn) and _relkind(conn, table) == "p"
+    return _partitioned_cache[table]
+
+def ensure_partition(conn, table: str, month: date) -> str:
+    start, end = month_bounds(month)
+    name = partition_name(table, start)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} FOR VALUES FROM ('{start}') TO ('{end}')"
+    ))
+    return name
+
+# ----------- One-time migration (Postgres only) ------------
+def _convert_to_partitioned(conn, table: str, column: str):
+    """Plain table -> RANGE(month) partitioned table, keeping data, ids and the id sequence."""
+    legacy = f"{table}_legacy"
+    logger.info(f"Converting {table} to a month-partitioned table")
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    # Keep the id sequence alive when the legacy table is dropped
+    conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY NONE"))
+    conn.execute(text(f"ALTER TABLE {legacy} DROP CONSTRAINT IF EXISTS {table}_pkey"))
+    conn.execute(text(f"DROP INDEX IF EXISTS ix_{table}_id"))
+
+    conn.execute(text(f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})"))
+    # Partitioned primary keys must contain the partition key
+    conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})"))
+    conn.execute(text(f"CREATE INDEX ix_{table}_id ON {table} (id)"))
+    conn.execute(text(f"ALTER SEQUENCE IF EXISTS {table}_id_seq OWNED BY {table}.id"))
+
+    months = conn.execute(text(f"SELECT DISTINCT date_trunc('month', {column})::date FROM {legacy}")).scalars().all()
+    for month in months:
+        ensure_partition(conn, table, month)
+
+    conn.execute(text(f"INSERT INTO {table} SELECT * FROM {legacy}"))
+    conn.execute(text(f"DROP TABLE {legacy}"))
+
+def ensure_partitioned(engine):
+    """Run at startup after create_all. No-op on SQLite and on already-partitioned tables."""
+    if not _is_postgres(engine):
+        return
+    with engine.begin() as conn:
+        without_statement_timeout(conn)  # the conversion copies every existing row
+        for table, column in PARTITIONED_TABLES.items():
+            if _relkind(conn, table) == "r":
+                _convert_to_partitioned(conn, table, column)
+    _partitioned_cache.clear()
+
+# ----------- Atomic month replacement ------------
+def _strip_to_columns(rows: List[dict], table) -> List[dict]:
+    names = {c.name for c in table.columns}
+    return [{k: v for k, v in row.items() if k in names} for row in rows]
+
+def replace_month(db: Session, model, month: date, rows: List[dict]):
+    """
+    Replaces every row of `model` for `month` with `rows`, inside the caller's
+    transaction (the caller commits). On Postgres the swap holds ACCESS
+    EXCLUSIVE locks until that commit, so call it last and commit right after.
+
+    Postgres (partitioned): rows are loaded into a staging table carrying the
+    month's CHECK constraint, then the old partition is detached/dropped and
+    the staging table attached in its place - a metadata swap, no DELETE bloat,
+    and readers never see a half-written month.
+    Anything else (SQLite, unmigrated tables): DELETE + bulk INSERT.
+    Rows dated outside `month` are appended to their own month.
+    """
+    table = model.__table__
+    column = PARTITIONED_TABLES[table.name]
+    start, end = month_bounds(month)
+    rows = _strip_to_columns(rows, table)
+
+    in_month = [r for r in rows if start <= r[column] < end]
+    others = [r for r in rows if not (start <= r[column] < end)]
+
+    conn = db.connection()
+    if not _is_partitioned(conn, table.name):
+        col = getattr(model, column)
+        db.query(model).filter(col >= start, col < end).delete(synchronize_session=False)
+        if rows:
+            db.execute(insert(model), rows)
+        return
+
+    part = partition_name(table.name, start)
+    staging = f"{part}_stage"
+    conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    conn.execute(text(f"CREATE TABLE {staging} (LIKE {table.name} INCLUDING DEFAULTS)"))
+    conn.execute(text(
+        f"ALTER TABLE {staging} ADD CONSTRAINT {part}_month_chk "
+        f"CHECK ({column} IS NOT NULL AND {column} >= '{start}' AND {column} < '{end}')"
+    ))
+    if in_month:
+        staging_table = table.to_metadata(MetaData(), name=staging)
+        conn.execute(insert(staging_table), in_month)
+
+    conn.execute(text(f"ALTER TABLE IF EXISTS {part} RENAME TO {part}_old"))
+    if conn.execute(text("SELECT to_regclass(:t)"), {"t": f"{part}_old"}).scalar():
+        conn.execute(text(f"ALTER TABLE {table.name} DETACH PARTITION {part}_old"))
+        conn.execute(text(f"DROP TABLE {part}_old"))
+    conn.execute(text(f"ALTER TABLE {staging} RENAME TO {part}"))
+    conn.execute(text(f"ALTER TABLE {table.name} ATTACH PARTITION {part} FOR VALUES FROM ('{start}') TO ('{end}')"))
+
+    for row in others:
+        ensure_partition(conn, table.name, row[column])
+    if others:
+        conn.execute(insert(table), others)
@@ -0,0 +1,216 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.documents import file_sha256, get_documents, load_bank_frame, remember_statement
+from app.extract import pdf_to_text
+from app.llm import extract_with_llm
+from app.managers import ManagerProfile, classify_document, get_manager
+from app.reconcile import run_reconciliation
+from app.schemas import ExtractedDoc
+from app.utils import get_relevant_text, parse_any_date
+
+logger = logging.getLogger(__name__)
+
+# Max statements extracted at once (PDF parse + LLM calls) per reconcile
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "4"))
+
+# progress(stage, **data) - e.g. ReconcileJob.emit; may be called from worker threads
+Progress = Optional[Callable[..., None]]
+
+def _no_progress(stage, **data):
+    pass
+
+def _llm_parser(text: str, manager: ManagerProfile):
+    return extract_with_llm(text, rules=manager.prompt_rules or None)
+
+# Parser per manager profile ("parser" field in the registry)
+PARSERS = {
+    "llm": _llm_parser,
+}
+
+class ExtractionError(ValueError):
+    """A statement couldn't be classified or its extraction failed validation."""
+
+@dataclass
+class StatementFile:
+    filename: str
+    content: bytes
+
+@dataclass
+class ParsedStatement:
+    filename: str
+    manager: ManagerProfile
+    doc: ExtractedDoc
+    page_text: str = ""
+    cached: bool = False
+
+# ----------- Single statement ------------
+def extract_statement(statement: StatementFile, progress: Progress = None) -> ParsedStatement:
+    """PDF -> text -> manager classification -> page selection -> parser -> validated doc."""
+    progress = progress or _no_progress
+    text = pdf_to_text(statement.content)
+    progress("pages_parsed", file=statement.filename, chars=len(text))
+
+    manager = classify_document(text, statement.filename)
+    if manager is None:
+        raise ValueError(f"Could not identify the property manager for {statement.filename}")
+
+    relevant_text = get_relevant_text(text, list(manager.page_indices)) if manager.page_indices else text
+
+    parser = PARSERS.get(manager.parser)
+    if parser is None:
+        raise ValueError(f"Unknown parser '{manager.parser}' for {manager.name}")
+
+    parsed = parser(relevant_text, manager)
+    if not parsed.get("properties"):
+        logger.error(f"{statement.filename} ({manager.name}) failed to return property data")
+
+    result = ParsedStatement(
+        filename=statement.filename,
+        manager=manager,
+        doc=normalize_doc(parsed, manager),
+        page_text=text
+    )
+    progress("document_extracted", file=statement.filename, manager=manager.name,
+             properties=len(result.doc.properties), cached=False)
+    return result
+
+def normalize_doc(parsed: dict, manager: ManagerProfile) -> ExtractedDoc:
+    """Applies the registry's naming rules: the canonical manager name wins over the LLM's."""
+    doc = ExtractedDoc(**dict(parsed, property_management=manager.name))
+
+    # Inject the manager name into each property so the data isn't lost
+    for p in doc.properties:
+        p.property_management = doc.property_management
+    return doc
+
+# ----------- Many statements, bounded parallelism ------------
+async def extract_statements(statements: List[StatementFile], progress: Progress = None) -> List[ParsedStatement]:
+    semaphore = asyncio.Semaphore(EXTRACT_CONCURRENCY)
+
+    async def _run(statement):
+        async with semaphore:
+            # PyMuPDF + Groq client are blocking; keep them off the event loop
+            return await asyncio.to_thread(extract_statement, statement, progress)
+
+    return await asyncio.gather(*[_run(s) for s in statements])
+
+# ----------- Document registry short-circuit ------------
+async def load_statements(db: Session, statements: List[StatementFile], progress: Progress = None) -> List[ParsedStatement]:
+    """
+    Reuses the extraction for any file whose bytes were seen before and only
+    runs PDF parsing + LLM for new files. New results are added to the
+    registry in the caller's session. Session work runs in a worker thread,
+    like the extraction itself.
+    """
+    progress = progress or _no_progress
+    hashes = [file_sha256(s.content) for s in statements]
+    known = await asyncio.to_thread(get_documents, db, hashes)
+
+    results = [None] * len(statements)
+    misses = []
+    for i, (statement, sha256) in enumerate(zip(statements, hashes)):
+        cached = known.get(sha256)
+        manager = get_manager(cached.property_management) if cached is not None else None
+        if cached is not None and cached.extracted and manager is not None:
+            logger.info(f"{statement.filename} already seen, skipping extraction")
+            results[i] = ParsedStatement(
+                filename=statement.filename,
+                manager=manager,
+                doc=normalize_doc(cached.extracted, manager),
+                page_text=cached.page_text or "",
+                cached=True
+            )
+            progress("document_extracted", file=statement.filename, manager=manager.name,
+                     properties=len(results[i].doc.properties), cached=True)
+        else:
+            misses.append(i)
+
+    extracted = await extract_statements([statements[i] for i in misses], progress)
+    for i, parsed in zip(misses, extracted):
+        results[i] = parsed
+    await asyncio.to_thread(_remember_statements, db, [hashes[i] for i in misses], extracted)
+    return results
+
+def _remember_statements(db: Session, hashes: List[str], extracted: List[ParsedStatement]):
+    remembered = set()
+    for sha256, parsed in zip(hashes, extracted):
+        # Same bytes uploaded twice in one request -> store once;
+        # empty extractions aren't cached so a retry gets another LLM attempt
+        if sha256 in remembered or not parsed.doc.properties:
+            continue
+        remembered.add(sha256)
+        remember_statement(db, sha256, parsed.filename, parsed.manager.name, parsed.page_text, parsed.doc.model_dump())
+
+# ----------- Statement rows ------------
+def statement_rows(parsed_statements: List[ParsedStatement]) -> List[dict]:
+    """RentalStatement rows for the parsed documents (written by run_reconciliation)."""
+    rows = []
+    for parsed in parsed_statements:
+        doc = parsed.doc
+        stmt_date_obj = parse_any_date(doc.statement_date)
+        property_management = doc.property_management.strip().upper()
+
+        for prop in doc.properties:
+            calc_net = float(prop.rent_paid - prop.management_fees) # Ensure float, not numpy
+
+            rows.append(dict(
+                statement_date=stmt_date_obj, 
+                property_management=property_management,
+                address=prop.address,
+                rent_amount=prop.rent_amount,
+                rent_paid=prop.rent_paid,
+                management_fees=prop.management_fees,
+                net_income=calc_net,
+                source_file=parsed.filename
+            ))
+    return rows
+
+def merged_properties(parsed_statements: List[ParsedStatement]):
+    ## Merge all PDF properties for reconciliation
+    return [p for parsed in parsed_statements for p in parsed.doc.properties]
+
+# ----------- Full reconcile run ------------
+async def reconcile_uploads(
+    db: Session,
+    statement_files: List[StatementFile],
+    bank_filename: str,
+    bank_bytes: bytes,
+    target_month,
+    progress: Progress = None
+):
+    """
+    Everything /reconcile does after reading the uploads: registry lookup,
+    concurrent extraction, bank parsing, reconciliation and publishing the
+    month, reporting each stage through `progress`.
+    """
+    progress = progress or _no_progress
+    progress("uploaded", files=[s.filename for s in statement_files], bank=bank_filename)
+
+    # Registry lookups, pandas/openpyxl parsing and commits block; keep them all off the event loop
+    bank_df = await asyncio.to_thread(load_bank_frame, db, bank_filename, bank_bytes)
+    try:
+        parsed_statements = await load_statements(db, statement_files, progress)
+    except ValueError as e:
+        await asyncio.to_thread(db.rollback)
+        raise ExtractionError(str(e)) from e
+    await asyncio.to_thread(db.commit)  # document registry entries
+
+    all_props = merged_properties(parsed_statements)
+    rows = statement_rows(parsed_statements)
+
+    await asyncio.to_thread(
+        run_reconciliation,
+        db=db,
+        bank_df=bank_df,
+        extracted_props=all_props,
+        target_month=target_month,
+        statement_rows=rows,
+        progress=progress  # reconciled / published / emailed, each as it happens
+    )
+    return parsed_statements
@@ -0,0 +1,88 @@
+"""
+Read models for the HTML pages: only the columns a template displays,
+selected as plain rows (no ORM instances, no identity map) into immutable
+named tuples. Templates read them with the same attribute names as the
+models, so `{{ s.rent_paid }}` works unchanged.
+"""
+from datetime import date
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.partitions import month_bounds
+
+class StatementRow(NamedTuple):
+    statement_date: date
+    property_management: Optional[str]
+    address: Optional[str]
+    rent_paid: Optional[float]
+    management_fees: Optional[float]
+
+class ReconRow(NamedTuple):
+    address: str
+    property_management: str
+    target_rent: float
+    actual_rent: float
+    rent_variance: float
+    target_hoa: float
+    actual_hoa: float
+    hoa_variance: float
+    target_mortgage: float
+    actual_mortgage: float
+    mortgage_variance: float
+    status: Optional[str]
+
+class MiscRow(NamedTuple):
+    date_cleared: Optional[date]
+    description: Optional[str]
+    amount: Optional[float]
+    category_suggestion: Optional[str]
+
+def _select(row_type, model):
+    return select(*[getattr(model, field) for field in row_type._fields])
+
+async def _fetch(db: AsyncSession, row_type, stmt) -> list:
+    return [row_type._make(row) for row in (await db.execute(stmt)).all()]
+
+def _in_month(column, month: date):
+    # A range (not extract(year/month)) so the index / month partition is used
+    start, end = month_bounds(month)
+    return (column >= start, column < end)
+
+# ----------- Queries ------------
+async def month_statements(db: AsyncSession, month: date) -> List[StatementRow]:
+    RentalStatement = models.RentalStatement
+    stmt = (
+        _select(StatementRow, RentalStatement)
+        .where(*_in_month(RentalStatement.statement_date, month))
+        .order_by(RentalStatement.statement_date.desc())
+    )
+    return await _fetch(db, StatementRow, stmt)
+
+async def statement_history(
+    db: AsyncSession,
+    month: Optional[date] = None,
+    property_management: Optional[str] = None,
+    property_name: Optional[str] = None
+) -> List[StatementRow]:
+    RentalStatement = models.RentalStatement
+    stmt = _select(StatementRow, RentalStatement)
+    if month:
+        stmt = stmt.where(*_in_month(RentalStatement.statement_date, month))
+    if property_management:
+        stmt = stmt.where(RentalStatement.property_management == property_management)
+    if property_name:
+        stmt = stmt.where(RentalStatement.address.ilike(f"%{property_name}%"))
+    return await _fetch(db, StatementRow, stmt.order_by(RentalStatement.statement_date.desc()))
+
+async def month_recon(db: AsyncSession, month: date) -> List[ReconRow]:
+    PropertyReconLog = models.PropertyReconLog
+    stmt = _select(ReconRow, PropertyReconLog).where(*_in_month(PropertyReconLog.month_year, month))
+    return await _fetch(db, ReconRow, stmt)
+
+async def month_misc(db: AsyncSession, month: date) -> List[MiscRow]:
+    MiscExpenseLog = models.MiscExpenseLog
+    stmt = _select(MiscRow, MiscExpenseLog).where(*_in_month(MiscExpenseLog.month_year, month))
+    return await _fetch(db, MiscRow, stmt)
@@ -1,121 +1,161 @@
+import numpy as np
 import pandas as pd
 from sqlalchemy.orm import Session
-from sqlalchemy import extract
 from datetime import date
-from typing import List
-import re
-from app.models import PropertyParameter, PropertyReconLog, MiscExpenseLog, RentalStatement
+from typing import Callable, List, Optional
+from app.models import PropertyReconLog, MiscExpenseLog, RentalStatement
 from app.schemas import PropertyDetail
-from app.utils import extract_house_number, send_reconciliation_email
-
-def run_reconciliation(db: Session, bank_df: pd.DataFrame, extracted_props: List[PropertyDetail], target_month: date):
-    # --- 1. PRE-RECONCILIATION CLEANUP ---
-    try:
-        for model in [PropertyReconLog, MiscExpenseLog]:
-            db.query(model).filter(
-                extract('month', model.month_year) == target_month.month,
-                extract('year', model.month_year) == target_month.year
-            ).delete(synchronize_session=False)
-        db.commit()
-    except Exception as e:
-        db.rollback()
-        print(f"Cleanup failed: {e}")
-    
+from app.managers import all_bank_aliases
+from app.classify import get_classifier, HOA, MORTGAGE, MISC
+from app.parameters import parameter_store
+from app.partitions import replace_month
+from app.rollups import refresh_month
+from app.anomaly import score_month
+from app.money import to_cents, from_cents, within_tolerance
+from app.mailer import enqueue_reconciliation_email, outbox_sender
+
+def _row_dict(obj):
+    """Column values of a transient ORM object (unset columns left to their defaults)."""
+    return {
+        c.name: getattr(obj, c.name) for c in obj.__table__.columns
+        if c.name != "id" and getattr(obj, c.name) is not None
+    }
+
+def run_reconciliation(
+    db: Session,
+    bank_df: pd.DataFrame,
+    extracted_props: List[PropertyDetail],
+    target_month: date,
+    send_email: bool = True,
+    statement_rows: Optional[List[dict]] = None,
+    progress: Optional[Callable[..., None]] = None
+):
+    """
+    Reconciles one month and publishes its results atomically: recon logs,
+    misc expenses, trend rollups and (when given) the month's RentalStatement
+    rows replace the previous month in a single transaction, so a failure
+    never leaves a half-empty month. `progress(stage, **data)` is told as each
+    stage actually finishes: reconciled, published (committed), emailed.
+    """
+    progress = progress or (lambda stage, **data: None)
     # Pre-calculate bank totals by Merchant (e.g., 'GOGO PROPERTY...', 'Sure Realty...')
     bank_totals = bank_df.groupby('Merchant')['Amount'].sum().to_dict()
 
     # --- 3. CORE RECONCILIATION LOOP ---
-    prop_master = db.query(PropertyParameter).filter(PropertyParameter.effective_to == None).all()
-    all_house_nums = [p.address.split()[0] for p in prop_master]
+    # Parameters as of the month being reconciled (not today's), from the in-process store
+    prop_master = parameter_store.for_month(db, target_month)
+    all_house_nums = [p.address.split()[0] for p in prop_master] # e.g., "2560"
+
+    # Label every bank row once (property / HOA / mortgage / manager deposit / misc)
+    classifier = get_classifier(all_house_nums, all_bank_aliases())
+    labeled_df = classifier.label(bank_df)
+    deductions = labeled_df[labeled_df['category'].isin([HOA, MORTGAGE])].groupby(
+        ['house_num', 'category']
+    )['Amount'].sum()
 
     # 1. Initialize an empty list to store logs for the email
     recon_logs = []
 
     try:
-        for prop in prop_master:
-            addr_num = prop.address.split()[0] # e.g., "2560"
-    
-            # 2. Find match in PDF data by comparing ONLY the house numbers
-            match = next((
-                p for p in extracted_props 
-                if p.address.split()[0] == addr_num
-            ), None)
-
-            actual_rent = match.rent_paid if match else 0.0
-            manager_name = prop.property_management
-            
-            # B. Bank Deductions (HOA & Mortgage) via Description Search
-            # Filter bank rows for this property's house number
-            prop_txs = bank_df[bank_df['Description'].str.contains(addr_num, case=False, na=False)]
-            
-            actual_hoa = float(abs(prop_txs[prop_txs['Merchant'].str.contains('HOA', case=False, na=False)]['Amount'].sum()))
-            actual_mortgage = float(abs(prop_txs[prop_txs['Merchant'].str.contains('Mortgage', case=False, na=False)]['Amount'].sum()))
-
-            # C. Bulk Rent Deposit Check
-            # Find the bank transaction for this property's manager
+        # 2. Find match in PDF data by comparing ONLY the house numbers (first match wins)
+        rent_by_house = {}
+        for p in extracted_props:
+            rent_by_house.setdefault(p.address.split()[0], p.rent_paid)
+
+        # B. Bulk Rent Deposit Check
+        # Find the bank transaction for each property's manager
+        def _bank_deposit(manager_name):
             merchant_key = next((m for m in bank_totals.keys() if manager_name.lower() in m.lower()), None)
-            bank_net_deposit = bank_totals.get(merchant_key, 0.0) if merchant_key else 0.0
-
-            # D. Status Determination
-            v_rent = float(actual_rent - prop.expected_rent)
-            v_mort = float(actual_mortgage - prop.mortgage_payment)
-
-            # Special case: 407 Wards Creek Way HOA is quarterly
-            if "407" in addr_num and actual_hoa == 0:
-                v_hoa = 0.0 # Mark as matched for quarterly logic if payment exists
-            else:
-                v_hoa = float(actual_hoa - prop.hoa_fee)
-
-            status = "MATCHED" if (v_rent == 0 and v_hoa == 0 and v_mort == 0) else "DISCREPANCY"
-            if actual_rent == 0 and actual_hoa == 0: status = "MISSING"
-
-            log_entry = PropertyReconLog(
+            return bank_totals.get(merchant_key, 0.0) if merchant_key else 0.0
+        deposit_by_manager = {prop.property_management: _bank_deposit(prop.property_management) for prop in prop_master}
+
+        # C. Whole-month arrays in integer cents (exact, no float equality)
+        target_rent = to_cents([prop.expected_rent for prop in prop_master])
+        target_hoa = to_cents([prop.hoa_fee for prop in prop_master])
+        target_mort = to_cents([prop.mortgage_payment for prop in prop_master])
+        actual_rent = to_cents([rent_by_house.get(num, 0.0) for num in all_house_nums])
+        actual_hoa = np.abs(to_cents([deductions.get((num, HOA), 0.0) for num in all_house_nums]))
+        actual_mort = np.abs(to_cents([deductions.get((num, MORTGAGE), 0.0) for num in all_house_nums]))
+        bank_deposit = to_cents([deposit_by_manager[prop.property_management] for prop in prop_master])
+
+        # D. Status Determination (vectorized)
+        v_rent = actual_rent - target_rent
+        v_mort = actual_mort - target_mort
+        v_hoa = actual_hoa - target_hoa
+
+        # HOA paid less often than monthly (hoa_frequency Q/S/A): a month with no payment is an off month
+        hoa_period = np.array([prop.hoa_period for prop in prop_master], dtype=np.int64)
+        hoa_off_month = (hoa_period > 1) & (actual_hoa == 0)
+        v_hoa[hoa_off_month] = 0 # Mark as matched for periodic HOA logic if no payment is due
+
+        matched = (
+            within_tolerance(actual_rent, target_rent, "rent")
+            & (within_tolerance(actual_hoa, target_hoa, "hoa") | hoa_off_month)
+            & within_tolerance(actual_mort, target_mort, "mortgage")
+        )
+        missing = (actual_rent == 0) & (actual_hoa == 0)
+        status = np.where(missing, "MISSING", np.where(matched, "MATCHED", "DISCREPANCY"))
+
+        for i, prop in enumerate(prop_master):
+            recon_logs.append(PropertyReconLog(
                 month_year=target_month,
                 address=prop.address,
-                property_management=manager_name,
-                target_rent=prop.expected_rent,
-                actual_rent=actual_rent,
-                rent_variance=v_rent,
-                target_hoa=prop.hoa_fee,
-                actual_hoa=actual_hoa,
-                hoa_variance=v_hoa,
-                target_mortgage=prop.mortgage_payment,
-                actual_mortgage=actual_mortgage,
-                mortgage_variance=v_mort,
-                bank_deposit_total=bank_net_deposit,
-                status=status
-            )
-
-            # Add to list AND the DB session
-            recon_logs.append(log_entry)
-            db.add(log_entry)
+                property_management=prop.property_management,
+                target_rent=from_cents(target_rent[i]),
+                actual_rent=from_cents(actual_rent[i]),
+                rent_variance=from_cents(v_rent[i]),
+                target_hoa=from_cents(target_hoa[i]),
+                actual_hoa=from_cents(actual_hoa[i]),
+                hoa_variance=from_cents(v_hoa[i]),
+                target_mortgage=from_cents(target_mort[i]),
+                actual_mortgage=from_cents(actual_mort[i]),
+                mortgage_variance=from_cents(v_mort[i]),
+                bank_deposit_total=from_cents(bank_deposit[i]),
+                status=str(status[i])
+            ))
 
         # --- 4. MISCELLANEOUS EXPENSES ---
         misc_logs = []
 
-        pattern = '|'.join(all_house_nums)
-        misc_df = bank_df[
-            (~bank_df['Description'].str.contains(pattern, case=False, na=False)) & 
-            (~bank_df['Merchant'].str.contains('HOA|Mortgage', case=False, na=False)) &
-            (~bank_df['Merchant'].str.contains('GOGO PROPERTY|Sure Realty', case=False, na=False))
-        ]
+        misc_df = labeled_df[labeled_df['category'] == MISC]
 
         for _, row in misc_df.iterrows():
             misc_entry = MiscExpenseLog(
                 month_year=target_month,
-                date_cleared=row['Date'],
+                date_cleared=row['Date'].date() if pd.notna(row['Date']) else None,
                 description=row['Description'],
                 amount=row['Amount'],
                 category_suggestion=row.get('Merchant', 'Misc')
             )
-            db.add(misc_entry)
             misc_logs.append(misc_entry)
 
+        progress("reconciled", properties=len(recon_logs), misc_expenses=len(misc_logs))
+
+        # --- 5. PUBLISH THE MONTH (one transaction) ---
+        recon_rows = [_row_dict(log) for log in recon_logs]
+        # Trend rollups for the month move with it
+        refresh_month(db, target_month, recon_rows, statement_rows)
+        # Outliers against each property's history (and the baselines learn this month)
+        score_month(db, target_month, recon_rows, prop_master)
+        # Queue the email in the same transaction (skipped, never fatal, if mail isn't configured)
+        queued = send_email and enqueue_reconciliation_email(
+            db, recon_logs=recon_logs, misc_logs=misc_logs, target_month=target_month
+        )
+
+        # Partition swaps last: DETACH/ATTACH take ACCESS EXCLUSIVE locks that readers
+        # of these tables queue behind, so nothing else runs between them and the commit
+        if statement_rows is not None:
+            replace_month(db, RentalStatement, target_month, statement_rows)
+        replace_month(db, PropertyReconLog, target_month, recon_rows)
+        replace_month(db, MiscExpenseLog, target_month, [_row_dict(item) for item in misc_logs])
         db.commit()
-
-        # Trigger Email
-        send_reconciliation_email(recon_logs=recon_logs, misc_logs=misc_logs, target_month=target_month)
+        progress("published", statements=len(statement_rows) if statement_rows is not None else None,
+                 recon_logs=len(recon_rows), misc_expenses=len(misc_logs))
+        if queued:
+            outbox_sender.wake()
+        progress("emailed", queued=bool(queued))
 
     except Exception as e:
         db.rollback()
         print(f"Reconciliation Failed: {e}")
+        raise
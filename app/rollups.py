@@ -0,0 +1,178 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import List, Optional
+
+from sqlalchemy import delete, extract, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import without_statement_timeout
+from app.models import MonthlyRollup, PropertyReconLog, RentalStatement
+from app.money import Money, to_cents, from_cents
+from app.partitions import month_bounds
+
+logger = logging.getLogger(__name__)
+
+TREND_GROUPS = ("property", "manager")
+ROLLUP_COLUMNS = ["target_rent", "actual_rent", "net_income", "hoa_variance", "mortgage_variance"]
+
+# ----------- Incremental refresh ------------
+def _house_number(address) -> str:
+    # Same matching rule as run_reconciliation: statements and parameters share the leading house number
+    parts = str(address or "").split()
+    return parts[0] if parts else ""
+
+def refresh_month(db: Session, month: date, recon_rows: List[dict], statement_rows: Optional[List[dict]] = None):
+    """
+    Rebuilds one month's rollup rows from the recon logs (and statements) being
+    published. Called inside the publishing transaction, so rollups never
+    disagree with the month they summarize.
+    """
+    start, end = month_bounds(month)
+    if statement_rows is None:
+        statement_rows = [
+            dict(r._mapping) for r in db.execute(
+                select(RentalStatement.address, RentalStatement.rent_paid, RentalStatement.management_fees)
+                .where(RentalStatement.statement_date >= start, RentalStatement.statement_date < end)
+            )
+        ]
+
+    fees = defaultdict(int)
+    net = defaultdict(int)
+    for row in statement_rows:
+        house = _house_number(row.get("address"))
+        rent_cents = int(to_cents(row.get("rent_paid")))
+        fee_cents = int(to_cents(row.get("management_fees")))
+        fees[house] += fee_cents
+        net[house] += rent_cents - fee_cents
+
+    rollups = []
+    for row in recon_rows:
+        house = _house_number(row["address"])
+        rollups.append({
+            "month_year": start,
+            "address": row["address"],
+            "property_management": row.get("property_management"),
+            "target_rent": row.get("target_rent", 0.0),
+            "actual_rent": row.get("actual_rent", 0.0),
+            "management_fees": from_cents(fees.get(house, 0)),
+            "net_income": from_cents(net.get(house, 0)),
+            "hoa_variance": row.get("hoa_variance", 0.0),
+            "mortgage_variance": row.get("mortgage_variance", 0.0),
+            "status": row.get("status"),
+        })
+
+    db.execute(delete(MonthlyRollup).where(MonthlyRollup.month_year == start))
+    if rollups:
+        db.execute(insert(MonthlyRollup), rollups)
+
+def rebuild_missing_rollups(db: Session) -> int:
+    """One-time catch-up for months reconciled before rollups existed."""
+    without_statement_timeout(db)
+    recon_months = {m for (m,) in db.execute(select(PropertyReconLog.month_year).distinct())}
+    rolled_up = {m for (m,) in db.execute(select(MonthlyRollup.month_year).distinct())}
+    missing = sorted({month_bounds(m)[0] for m in recon_months} - rolled_up)
+
+    for month in missing:
+        start, end = month_bounds(month)
+        recon_rows = [
+            {c.name: getattr(log, c.name) for c in PropertyReconLog.__table__.columns}
+            for log in db.execute(
+                select(PropertyReconLog).where(PropertyReconLog.month_year >= start, PropertyReconLog.month_year < end)
+            ).scalars()
+        ]
+        refresh_month(db, month, recon_rows)
+    if missing:
+        db.commit()
+        logger.info(f"Built rollups for {len(missing)} previously reconciled month(s)")
+    return len(missing)
+
+# ----------- Trend queries ------------
+def _trend_query(start: date, end: date, group_by: str):
+    key = MonthlyRollup.address if group_by == "property" else MonthlyRollup.property_management
+
+    # Per-key monthly totals from Jan 1 of the first year, so YTD windows see the whole year
+    monthly = (
+        select(
+            MonthlyRollup.month_year.label("month_year"),
+            key.label("key"),
+            *[func.sum(getattr(MonthlyRollup, c)).label(c) for c in ROLLUP_COLUMNS],
+            func.count().label("properties"),
+        )
+        .where(MonthlyRollup.month_year >= date(start.year, 1, 1), MonthlyRollup.month_year < end)
+        .group_by(MonthlyRollup.month_year, key)
+        .subquery()
+    )
+
+    by_key = dict(partition_by=monthly.c.key, order_by=monthly.c.month_year)
+    ytd = dict(partition_by=[monthly.c.key, extract("year", monthly.c.month_year)], order_by=monthly.c.month_year)
+    windowed = select(
+        monthly,
+        func.sum(monthly.c.target_rent).over(**ytd).label("ytd_target_rent"),
+        func.sum(monthly.c.actual_rent).over(**ytd).label("ytd_actual_rent"),
+        func.sum(monthly.c.net_income).over(**ytd).label("ytd_net_income"),
+        # Typed so Postgres NUMERIC comes back as float like the sums (not Decimal)
+        func.avg(monthly.c.net_income, type_=Money).over(rows=(-2, 0), **by_key).label("net_income_3mo_avg"),
+        func.lag(monthly.c.net_income, type_=Money).over(**by_key).label("prev_net_income"),
+    ).subquery()
+
+    return (
+        select(windowed)
+        .where(windowed.c.month_year >= start)
+        .order_by(windowed.c.key, windowed.c.month_year)
+    )
+
+def _rate(actual, target):
+    return round(actual / target, 4) if target else None
+
+def _money(value):
+    return from_cents(to_cents(value))
+
+def trend_report(db: Session, start: date, end: date, group_by: str = "property") -> dict:
+    """
+    Monthly series per property or manager for [start, end] (whole months),
+    with YTD running totals, collection rates and a 3-month net income average.
+    """
+    start, _ = month_bounds(start)
+    _, end_exclusive = month_bounds(end)
+    rows = db.execute(_trend_query(start, end_exclusive, group_by)).mappings().all()
+
+    series = {}
+    portfolio = defaultdict(lambda: dict.fromkeys(ROLLUP_COLUMNS, 0))
+    for row in rows:
+        month = row["month_year"].strftime("%Y-%m")
+        point = {
+            "month": month,
+            "properties": row["properties"],
+            **{c: _money(row[c]) for c in ROLLUP_COLUMNS},
+            "collection_rate": _rate(row["actual_rent"] or 0, row["target_rent"] or 0),
+            "ytd_net_income": _money(row["ytd_net_income"]),
+            "ytd_collection_rate": _rate(row["ytd_actual_rent"] or 0, row["ytd_target_rent"] or 0),
+            "net_income_3mo_avg": _money(row["net_income_3mo_avg"]),
+            "net_income_change": None if row["prev_net_income"] is None
+                else from_cents(int(to_cents(row["net_income"]) - to_cents(row["prev_net_income"]))),
+        }
+        entry = series.setdefault(row["key"] or "Self Managed", {"key": row["key"] or "Self Managed", "months": []})
+        entry["months"].append(point)
+        for c in ROLLUP_COLUMNS:
+            portfolio[month][c] += int(to_cents(row[c]))
+
+    for entry in series.values():
+        totals = {c: from_cents(int(to_cents([m[c] for m in entry["months"]]).sum())) for c in ROLLUP_COLUMNS}
+        totals["collection_rate"] = _rate(totals["actual_rent"], totals["target_rent"])
+        entry["totals"] = totals
+
+    return {
+        "start": start.strftime("%Y-%m"),
+        "end": end.strftime("%Y-%m"),
+        "group_by": group_by,
+        "series": sorted(series.values(), key=lambda e: e["key"]),
+        "portfolio": [
+            {"month": month, **{c: from_cents(v) for c, v in totals.items()},
+             "collection_rate": _rate(totals["actual_rent"], totals["target_rent"])}
+            for month, totals in sorted(portfolio.items())
+        ],
+    }
+
+def latest_rollup_month(db: Session) -> Optional[date]:
+    return db.execute(select(func.max(MonthlyRollup.month_year))).scalar()
@@ -0,0 +1,27 @@
+import os
+import logging
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_DIR = "app/templates"
+# Templates only change on deploy; set TEMPLATE_AUTO_RELOAD=1 while editing them locally
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "0") == "1"
+
+template_env = Environment(
+    loader=FileSystemLoader(TEMPLATE_DIR),
+    autoescape=select_autoescape(["html", "xml"]),
+    auto_reload=TEMPLATE_AUTO_RELOAD,  # no stat() of the source on every render
+    cache_size=-1                      # never evict a compiled template
+)
+
+def precompile_templates():
+    """Compiles every template once at startup, so no request pays for parsing."""
+    names = template_env.list_templates(extensions=["html"])
+    for name in names:
+        template_env.get_template(name)
+    logger.info(f"Compiled {len(names)} templates")
+
+html_templates = Jinja2Templates(env=template_env)
@@ -1,4 +1,5 @@
 import csv
+import json
 import io
 import os
 import smtplib
@@ -6,13 +7,12 @@ from fastapi.responses import StreamingResponse
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import logging
-import pandas as pd
 import re
 from datetime import datetime
-from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
-
-html_templates = Jinja2Templates(directory="app/templates")
+from app.money import to_cents, from_cents, money_matches
+from app.ingest import read_bank_export
+from app.templating import html_templates
 
 load_dotenv()
 
@@ -111,30 +111,15 @@ def get_relevant_text(text, page_indices):
 
 # ------- csv to Json conversion 
 def sheet_to_json(csv_file):
-    # 1. Read the raw bytes
+    # CSV / XLSX / JSON, sniffed and streamed by app.ingest (Date/Merchant/Description/Amount only)
     content = csv_file.file.read()
     csv_file.file.seek(0) # Reset pointer
-    
-    filename = csv_file.filename.lower()
-    
+
     try:
-        if filename.endswith('.xlsx') or filename.endswith('.xls'):
-            # Handle Excel files
-            df = pd.read_excel(io.BytesIO(content))
-        else:
-            # Handle CSV files with a fallback for encoding
-            try:
-                df = pd.read_csv(io.BytesIO(content), encoding='utf-8')
-            except UnicodeDecodeError:
-                # Fallback for files saved in Excel CSV format (Latin-1)
-                df = pd.read_csv(io.BytesIO(content), encoding='latin1')
-        
-        # Select your required columns
-        df = df[["Date", "Merchant", "Description", "Amount"]]
-        return df.to_dict(orient="records")
-        
-    except Exception as e:
+        df = read_bank_export(content, csv_file.filename)
+    except ValueError as e:
         raise ValueError(f"Could not parse sheet: {str(e)}")
+    return json.loads(df.to_json(orient="records", date_format="iso"))
 
 # ----------------- Email Notification ---------------------
 def send_reconciliation_email_old(summary_data, target_month):
@@ -197,28 +182,32 @@ def send_reconciliation_email_old(summary_data, target_month):
     return False
 
 ## ---------------- Email -----------------------------
-def send_reconciliation_email(recon_logs, misc_logs, target_month):
+def render_reconciliation_email(recon_logs, misc_logs, target_month):
+    """Returns (subject, html) for one month's reconciliation report."""
     display_month = target_month.strftime('%B %Y')
     link_month = target_month.strftime('%Y-%m')
 
-    # 1. Aggregate Totals
-    total_actual_rent = sum(log.actual_rent for log in recon_logs)
-    total_target_rent = sum(log.target_rent for log in recon_logs)
+    # 1. Aggregate Totals (in cents, so the comparison is exact)
+    def _total(field):
+        return from_cents(to_cents([getattr(log, field) for log in recon_logs]).sum())
+
+    total_actual_rent = _total("actual_rent")
+    total_target_rent = _total("target_rent")
     
-    total_actual_hoa = sum(log.actual_hoa for log in recon_logs)
-    total_target_hoa = sum(log.target_hoa for log in recon_logs)
+    total_actual_hoa = _total("actual_hoa")
+    total_target_hoa = _total("target_hoa")
     
-    total_actual_mort = sum(log.actual_mortgage for log in recon_logs)
-    total_target_mort = sum(log.target_mortgage for log in recon_logs)
+    total_actual_mort = _total("actual_mortgage")
+    total_target_mort = _total("target_mortgage")
 
     # 2. Structure Component Data
     components = [
         {"name": "Rent Reconciliation", "actual": total_actual_rent, "target": total_target_rent, 
-         "status": "MATCHED" if total_actual_rent == total_target_rent else "DISCREPANCY"},
+         "status": "MATCHED" if money_matches(total_actual_rent, total_target_rent, "rent") else "DISCREPANCY"},
         {"name": "HOA Fees Audit", "actual": total_actual_hoa, "target": total_target_hoa, 
-         "status": "MATCHED" if total_actual_hoa == total_target_hoa else "DISCREPANCY"},
+         "status": "MATCHED" if money_matches(total_actual_hoa, total_target_hoa, "hoa") else "DISCREPANCY"},
         {"name": "Mortgage Audit", "actual": total_actual_mort, "target": total_target_mort, 
-         "status": "MATCHED" if total_actual_mort == total_target_mort else "DISCREPANCY"}
+         "status": "MATCHED" if money_matches(total_actual_mort, total_target_mort, "mortgage") else "DISCREPANCY"}
     ]
 
     # 3. Render the Template
@@ -230,23 +219,4 @@ def send_reconciliation_email(recon_logs, misc_logs, target_month):
         components=components,
         misc_logs=misc_logs
     )
-
-    # 4. Email Sending Logic
-    msg = MIMEMultipart()
-    msg['From'] = sender
-    msg['To'] = receiver
-    msg['Subject'] = f"📊 Smart LLC - Reconciliation Report: {display_month}"
-    msg.attach(MIMEText(html_content, 'html'))    
-    
-    try:
-        server = smtplib.SMTP(smtp_server, smtp_port, timeout=20)
-        print(f"SMTP Server: {smtp_server} | Port: {smtp_port} | From: {sender} | To: {receiver}")
-        server.starttls()
-        server.login(sender.strip(), password.strip())
-        server.send_message(msg)
-        server.quit()
-        print(f"✅ Email sent successfully for {display_month}!")
-        return True
-    except Exception as e:
-        print(f"❌ Email Error: {e}")
-        return False
\ No newline at end of file
+    return f"📊 Smart LLC - Reconciliation Report: {display_month}", html_content